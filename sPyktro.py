@@ -8,8 +8,14 @@ import pyqtgraph as pg
 from pyqtgraph import PlotWidget
 from sPyktro_raman import Raman_Spectra
 from sPyktro_window import Ui_MainWindow
-from sPyktro_misc import Raman_Spectra_Init_Dialog, Preferences_window, Line_window
-from sPyktro_item import Spectra_item
+from sPyktro_misc import Raman_Spectra_Init_Dialog, Preferences_window, Line_window, Map_window, Live_window
+from sPyktro_item import Spectra_item, Spectra_List_Model
+from sPyktro_loader import Raman_Spectra_Loader
+from sPyktro_lod import Decimation_Pyramid
+from sPyktro_session import save_session, open_session
+from sPyktro_map import Raman_Map
+from sPyktro_live import Ring_Buffer, Live_Directory_Watcher, Live_Socket_Receiver
+from sPyktro_pipeline import Spectra_Pipeline
 import numpy as np
 import darkdetect
 
@@ -39,6 +45,15 @@ class sPyktro(QMainWindow, Ui_MainWindow):
 
         self.graphPlotItem.sigRangeChanged.connect(self.qtgraph_range_changed)
 
+        # spectra longer than lod_min_points are drawn from a decimation pyramid, only the visible part at about one block per pixel.
+        # Range changes are coalesced by the timer into one update per event loop pass
+        self.lod_min_points = 10000
+        self.lod_timer = QtCore.QTimer(self)
+        self.lod_timer.setSingleShot(True)
+        self.lod_timer.setInterval(0)
+        self.lod_timer.timeout.connect(self.graphWidget_lod_update_all)
+        self.graphViewBox.sigResized.connect(self.lod_timer.start)
+
         # disable right click menu for the plot area
         self.graphPlotItem.setMenuEnabled(False)
         #for i in self.graphQactions:
@@ -49,6 +64,17 @@ class sPyktro(QMainWindow, Ui_MainWindow):
 
         # new use this
         self.spectra_items = []
+        self.plotted_items = [] # the spectra items with a curve in the plot area
+        self.axis_extents = None # (xmin, xmax, ymin, ymax) over the visible spectras, None when it has to be gathered again
+
+        # batch overlay: the visible spectra sharing a pen are drawn as one curve, pen key -> (spectras in the curve, curve)
+        self.overlay_mode = False
+        self.overlay_curves = {}
+        self.actionOverlay = QAction("Batch Overlay", self)
+        self.actionOverlay.setCheckable(True)
+        self.menuEdit.addSeparator()
+        self.menuEdit.addAction(self.actionOverlay)
+        self.actionOverlay.toggled.connect(self.set_overlay_mode)
 
         # undo and redo
         self.actionUndo.triggered.connect(self.history_undo)
@@ -63,13 +89,62 @@ class sPyktro(QMainWindow, Ui_MainWindow):
 
         # load a spectra
         self.actionLoad.triggered.connect(self.load_new_raman_spectra)
+
+        # save and open the spectras with their styling as a session file
+        self.session_path = None
+        self.session_file = None # the open file the spectras of an opened session read from
+        self.actionOpen_session = QAction("Open Session", self)
+        self.menuProcess.insertAction(self.actionSave, self.actionOpen_session)
+        self.actionOpen_session.triggered.connect(self.session_open)
+        self.actionSave.triggered.connect(self.session_save)
+        self.actionSave_as.triggered.connect(self.session_save_as)
+
+        # open a raman map, the spectra picked in its window are added to the spectra list
+        self.map_windows = []
+        self.actionOpen_map = QAction("Open Map", self)
+        self.menuProcess.insertAction(self.actionSave, self.actionOpen_map)
+        self.actionOpen_map.triggered.connect(self.map_open)
+
+        # live acquisition: a source thread fills a ring buffer, the live curve and the waterfall are redrawn at most once per live_timer interval
+        self.live_source = None
+        self.live_window = None
+        self.live_curve = None
+        self.live_buffer_size = 500
+        self.live_timer = QtCore.QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(50)
+        self.live_timer.timeout.connect(self.live_update)
+        self.menuLive = QMenu("Live Acquisition", self)
+        self.actionLive_directory = self.menuLive.addAction("Watch Directory")
+        self.actionLive_socket = self.menuLive.addAction("Listen on Local Port")
+        self.menuProcess.insertMenu(self.actionSave, self.menuLive)
+        self.actionLive_directory.triggered.connect(self.live_open_directory)
+        self.actionLive_socket.triggered.connect(self.live_open_socket)
+
+        # processing recipes: the steps of a spectra saved as a Spectra_Pipeline json file, the same file sPyktro_cli.py runs
+        self.actionApply_recipe = QAction("Apply Recipe", self)
+        self.actionSave_recipe = QAction("Save Recipe of Selected", self)
+        self.menuProcess_2.addSeparator()
+        self.menuProcess_2.addAction(self.actionApply_recipe)
+        self.menuProcess_2.addAction(self.actionSave_recipe)
+        self.actionApply_recipe.triggered.connect(self.recipe_apply)
+        self.actionSave_recipe.triggered.connect(self.recipe_save)
+
+        # curves of an opened session are created a chunk per event loop pass, the list is shown at once
+        self.session_stream_items = []
+        self.session_stream_size = 200
+        self.session_stream_timer = QtCore.QTimer(self)
+        self.session_stream_timer.setInterval(0)
+        self.session_stream_timer.timeout.connect(self.session_stream_step)
         # preference
         self.actionPreference.triggered.connect(self.preferences_setting)
 
-        # list widget operation
-        self.listWidget.itemChanged.connect(self.listWidget_item_just_checked)
-        self.listWidget.itemSelectionChanged.connect(self.listWidget_item_just_selected)
-        self.listWidget.installEventFilter(self)
+        # list view operation, the model shares the spectra_items list
+        self.spectra_model = Spectra_List_Model(self.spectra_items, self)
+        self.listView.setModel(self.spectra_model)
+        self.spectra_model.check_changed.connect(self.listView_item_just_checked)
+        self.listView.selectionModel().selectionChanged.connect(self.listView_item_just_selected)
+        self.listView.installEventFilter(self)
 
         #delete
         self.actionDelete.triggered.connect(self.delete_selected_spectras)
@@ -111,8 +186,14 @@ class sPyktro(QMainWindow, Ui_MainWindow):
         self.history_update()
 
 
+    def closeEvent(self, event):
+        # the live source thread runs until it is stopped, the session file stays open until it is closed
+        self.live_stop()
+        self.session_close()
+        super().closeEvent(event)
+
     def eventFilter(self, source, event):
-        if event.type() == QEvent.ContextMenu and source is self.listWidget:
+        if event.type() == QEvent.ContextMenu and source is self.listView:
             menu = QMenu()
             context_duplicate = menu.addAction('Duplicate')
             context_delete = menu.addAction('Delete')
@@ -125,8 +206,8 @@ class sPyktro(QMainWindow, Ui_MainWindow):
 
             context_duplicate.triggered.connect(self.duplicate_selected_spectras)
             context_delete.triggered.connect(self.delete_selected_spectras)
-            context_show.triggered.connect(self.listWidget_item_show)
-            context_hide.triggered.connect(self.listWidget_item_hide)
+            context_show.triggered.connect(self.listView_item_show)
+            context_hide.triggered.connect(self.listView_item_hide)
             context_color.triggered.connect(self.color_picker)
             context_width.triggered.connect(self.set_line_width)
 
@@ -185,37 +266,280 @@ class sPyktro(QMainWindow, Ui_MainWindow):
         
         else:
             if result: # the raman init dialog is accepted
-                sample_name_string_list = popup.sample_name_string_list
-                start_float_list = popup.start_float_list
-                end_float_list = popup.end_float_list
-                generated_path_list = popup.return_path
-
-                for i in range(len(generated_path_list)):
-                    sample_name_string = sample_name_string_list[i]
-                    start_float = start_float_list[i]
-                    end_float = end_float_list[i]
-                    generated_path = generated_path_list[i]
-
-                    try:
-                        new_spectra = Raman_Spectra(generated_path, sample_name_string, start=start_float, end=end_float)
-                    except UnicodeDecodeError:
-                        self.show_error_win('Error', "UnicodeDecodeError raised while initializing " + sample_name_string)
-                    else:
-
-                        if self.background_color == "k":
-                            new_color = QColor(255, 255, 255)
-                        elif self.background_color == "w":
-                            new_color = QColor(0, 0, 0)
-
-                        self.spectra_items.append(Spectra_item(new_spectra, new_color))
-
-                        self.graphWidget_plot_update()
-                        self.reset_limit()
-                        self.listWidget_item_update()
-                        self.listWidget_checkbox_update()
-                        self.listWidget_color_update()
-
-                self.history_update()
+                self.rm_bulk_load(popup.return_path, popup.sample_name_string_list, popup.start_float_list, popup.end_float_list)
+
+    def rm_bulk_load(self, path_list, sample_name_list, start_list, end_list):
+        # parse the files on a worker pool and add them to the session in batches, one redraw per batch
+        if not path_list:
+            return
+
+        self.actionLoad.setEnabled(False)
+        self.rm_load_errors = []
+
+        self.rm_loader = Raman_Spectra_Loader(path_list, sample_name_list, start_list, end_list)
+        self.rm_load_progress = QProgressDialog("Loading spectra...", "Cancel", 0, len(path_list), self)
+        self.rm_load_progress.setWindowTitle("Load Spectras")
+        self.rm_load_progress.setWindowModality(Qt.WindowModal)
+        self.rm_load_progress.setMinimumDuration(500)
+
+        self.rm_load_progress.canceled.connect(self.rm_loader.cancel)
+        self.rm_loader.progress.connect(self.rm_load_progress.setValue)
+        self.rm_loader.batch_loaded.connect(self.rm_add_batch)
+        self.rm_loader.load_failed.connect(self.rm_load_error)
+        self.rm_loader.finished.connect(self.rm_bulk_load_finished)
+        self.rm_loader.start()
+
+    def rm_add_batch(self, spectra_list):
+        if self.background_color == "k":
+            new_color = QColor(255, 255, 255)
+        elif self.background_color == "w":
+            new_color = QColor(0, 0, 0)
+
+        new_items = [Spectra_item(new_spectra, QColor(new_color)) for new_spectra in spectra_list]
+        self.spectra_model.append_items(new_items)
+        self.axis_extents_add(new_items)
+
+        self.graphWidget_plot_update()
+        self.reset_limit()
+
+    def rm_load_error(self, error_message):
+        self.rm_load_errors.append(error_message)
+
+    def rm_bulk_load_finished(self):
+        self.rm_load_progress.reset()
+        self.actionLoad.setEnabled(True)
+        self.history_update()
+
+        if self.rm_load_errors:
+            self.show_error_win('Error', "\n".join(self.rm_load_errors[:10]))
+
+    def session_save(self):
+        if self.session_path is None:
+            self.session_save_as()
+        else:
+            self.session_write(self.session_path)
+
+    def session_save_as(self):
+        path = QFileDialog.getSaveFileName(self, 'Save Session', '', 'sPyktro Session (*.npz)')[0]
+        if path:
+            if not path.endswith('.npz'):
+                path = path + '.npz'
+            self.session_write(path)
+
+    def session_write(self, path):
+        (x_min, x_max), (y_min, y_max) = self.graphViewBox.viewRange()
+        if self.session_file is not None and os.path.abspath(self.session_file.path) == os.path.abspath(path):
+            # the open file can not be replaced on Windows. Its arrays are read first, the undo history may still use them
+            self.session_file.read_all()
+            self.session_close()
+        try:
+            save_session(path, [item.snapshot() for item in self.spectra_items], (x_min, x_max, y_min, y_max))
+        except (OSError, ValueError) as x:
+            self.show_error_win('Error', str(x))
+            return
+        self.session_path = path
+
+    def session_open(self):
+        path = QFileDialog.getOpenFileName(self, 'Open Session', '', 'sPyktro Session (*.npz)')[0]
+        if path:
+            self.session_load(path)
+
+    def session_load(self, path):
+        # replace the spectras with the ones of a session file. Only the metadata is read here,
+        # the spectra arrays are read as their curves are created by session_stream_step
+        try:
+            snapshots, view_limits, session_file = open_session(path)
+        except Exception as x:
+            self.show_error_win('Error', str(x))
+            return
+
+        # the spectras of the previous session are replaced and the history is cleared below, nothing reads its file anymore
+        self.session_close()
+        self.session_file = session_file
+
+        self.spectra_items = [Spectra_item.from_snapshot(snapshot) for snapshot in snapshots]
+        self.axis_extents = None
+        self.session_path = path
+
+        # the curves of the previous spectras are removed, the new ones are streamed in
+        self.graphWidget_remove_stale_curves()
+        self.listView_item_update()
+
+        if view_limits is not None:
+            self.graphWidget_set_x_limit(view_limits[0], view_limits[1])
+            self.graphWidget_set_y_limit(view_limits[2], view_limits[3])
+            self.make_push_button_reset()
+        else:
+            self.reset_limit()
+
+        self.history_states = []
+        self.history_which = -1
+        self.history_update()
+
+        if self.overlay_mode:
+            self.session_stream_items = []
+            self.graphWidget_plot_update()
+        else:
+            self.session_stream_items = [item for item in self.spectra_items if item.plot_bool]
+            self.session_stream_timer.start()
+
+    def session_close(self):
+        if self.session_file is not None:
+            self.session_file.close()
+            self.session_file = None
+
+    def session_stream_step(self):
+        chunk = self.session_stream_items[:self.session_stream_size]
+        self.session_stream_items = self.session_stream_items[self.session_stream_size:]
+        if not self.session_stream_items:
+            self.session_stream_timer.stop()
+
+        item_ids = set(id(item) for item in self.spectra_items)
+        for item in chunk:
+            if id(item) in item_ids and item.curve is None:
+                self.graphWidget_curve_update(item)
+                if item.curve is not None:
+                    self.plotted_items.append(item)
+
+    def map_open(self):
+        path = QFileDialog.getOpenFileName(self, 'Open Map', '', 'Raman Map (*.npy)')[0]
+        if path:
+            self.map_load(path)
+
+    def map_load(self, path):
+        try:
+            raman_map = Raman_Map.open(path)
+        except Exception as x:
+            self.show_error_win('Error', str(x))
+            return
+
+        map_window = Map_window(raman_map)
+        map_window.spectra_picked.connect(self.map_add_spectra)
+        map_window.finished.connect(lambda result: self.map_windows.remove(map_window))
+        self.map_windows.append(map_window)
+        map_window.show()
+
+    def map_add_spectra(self, spectra_list):
+        self.rm_add_batch(spectra_list)
+        self.history_update()
+
+    def live_open_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, 'Watch Directory')
+        if directory:
+            self.live_start(Live_Directory_Watcher(Ring_Buffer(self.live_buffer_size), directory), os.path.basename(directory))
+
+    def live_open_socket(self):
+        port, ok = QInputDialog.getInt(self, 'Listen on Local Port', 'Port:', 5000, 1024, 65535)
+        if not ok:
+            return
+        try:
+            source = Live_Socket_Receiver(Ring_Buffer(self.live_buffer_size), port)
+        except OSError as x:
+            self.show_error_win('Error', str(x))
+            return
+        self.live_start(source, "port " + str(port))
+
+    def live_start(self, source, source_name):
+        self.live_stop()
+
+        self.live_source = source
+        self.live_source.buffer_updated.connect(self.live_schedule_update)
+        self.live_source.receive_failed.connect(self.live_receive_error)
+
+        self.live_curve = pg.PlotDataItem(pen = pg.mkPen(QColor(255, 0, 0), width = 2))
+        self.graphPlotItem.addItem(self.live_curve)
+
+        self.live_window = Live_window(source_name)
+        self.live_window.add_requested.connect(self.live_add_latest)
+        self.live_window.finished.connect(self.live_stop)
+        self.live_window.show()
+
+        self.live_source.start()
+
+    def live_schedule_update(self):
+        # the timer is not restarted while it runs, so a fast source still gets a redraw every interval
+        if not self.live_timer.isActive():
+            self.live_timer.start()
+
+    def live_update(self):
+        if self.live_source is None:
+            return
+        ring_buffer = self.live_source.ring_buffer
+        latest = ring_buffer.get_latest()
+        if latest is None:
+            return
+
+        wavenumber, intensity, name = latest
+        self.live_curve.setData(wavenumber, intensity)
+        self.live_window.waterfall_update(wavenumber, ring_buffer.get_ordered(), ring_buffer.count, name)
+
+    def live_receive_error(self, error_message):
+        self.live_window.status_label.setText(error_message)
+
+    def live_add_latest(self):
+        latest = self.live_source.ring_buffer.get_latest()
+        if latest is not None:
+            wavenumber, intensity, name = latest
+            self.rm_add_batch([Raman_Spectra.from_arrays(wavenumber, intensity, name)])
+            self.history_update()
+
+    def live_stop(self):
+        if self.live_source is None:
+            return
+        live_source = self.live_source
+        self.live_source = None
+        self.live_timer.stop()
+        live_source.stop()
+        live_source.wait()
+
+        self.graphPlotItem.removeItem(self.live_curve)
+        self.live_curve = None
+        live_window = self.live_window
+        self.live_window = None
+        live_window.close()
+
+    def recipe_apply(self):
+        path = QFileDialog.getOpenFileName(self, 'Apply Recipe', '', 'sPyktro Recipe (*.json)')[0]
+        if path:
+            self.recipe_run(path)
+
+    def recipe_run(self, path):
+        # run a recipe over the selected spectras in one batch and add the results to the list
+        selected_spectras = [item.spectra for item in self.spectra_items if item.select_bool]
+        if not selected_spectras:
+            self.show_error_win('Error', "Select the spectras to apply the recipe to")
+            return
+
+        try:
+            pipeline = Spectra_Pipeline.load(path)
+            new_spectras = pipeline.run_spectra(selected_spectras)
+        except Exception as x:
+            self.show_error_win('Error', str(x))
+            return
+
+        self.rm_add_batch(new_spectras)
+        self.history_update()
+
+    def recipe_save(self):
+        selected_spectras = [item.spectra for item in self.spectra_items if item.select_bool]
+        if len(selected_spectras) != 1:
+            self.show_error_win('Error', "Select one spectra to save the recipe of its processing steps")
+            return
+
+        try:
+            pipeline = Spectra_Pipeline.from_lineage(selected_spectras[0].get_lineage())
+        except Exception as x:
+            self.show_error_win('Error', str(x))
+            return
+
+        path = QFileDialog.getSaveFileName(self, 'Save Recipe', '', 'sPyktro Recipe (*.json)')[0]
+        if path:
+            if not path.endswith('.json'):
+                path = path + '.json'
+            try:
+                pipeline.save(path)
+            except OSError as x:
+                self.show_error_win('Error', str(x))
 
     def update_all_limits(self):
         ax_x = self.graphPlotItem.getAxis("bottom")
@@ -282,8 +606,12 @@ class sPyktro(QMainWindow, Ui_MainWindow):
         
 
     def reset_limit(self):
-        if self.get_spectra_nums != 0:
-            xmin, xmax, ymin, ymax = self.get_largerst_axis_lim()
+        axis_extents = None
+        if self.get_spectra_nums() != 0:
+            axis_extents = self.get_largerst_axis_lim()
+
+        if axis_extents is not None:
+            xmin, xmax, ymin, ymax = axis_extents
             self.graphWidget_set_x_limit(xmin, xmax)
             self.graphWidget_set_y_limit(ymin, ymax)
 
@@ -294,28 +622,148 @@ class sPyktro(QMainWindow, Ui_MainWindow):
             return 0, 1, 0, 1
         
     def get_largerst_axis_lim(self):
-        xmin_list = []
-        xmax_list = []
-        ymin_list = []
-        ymax_list = []
-
-        for item in self.spectra_items:
+        # from the extents cached on each spectra, no array is read. The aggregate is kept while spectras are only added or shown,
+        # and gathered again from the visible items after a spectra is hidden or removed
+        if self.axis_extents is None:
+            extents = [item.spectra.get_extents() for item in self.spectra_items if item.plot_bool]
+            if not extents:
+                return None
+            extents = np.array(extents)
+            self.axis_extents = (float(np.amin(extents[:, 0])), float(np.amax(extents[:, 1])), float(np.amin(extents[:, 2])), float(np.amax(extents[:, 3])))
+
+        return self.axis_extents
+
+    def axis_extents_add(self, items):
+        # grow the aggregate by the extents of newly added or shown items
+        if self.axis_extents is None:
+            return
+        for item in items:
             if item.plot_bool:
-                a_x, a_y = item.spectra.get_spectra()
-                xmin_list.append(np.amin(a_x))
-                xmax_list.append(np.amax(a_x))
-                ymin_list.append(np.amin(a_y))
-                ymax_list.append(np.amax(a_y))
+                xmin, xmax, ymin, ymax = item.spectra.get_extents()
+                self.axis_extents = (min(self.axis_extents[0], xmin), max(self.axis_extents[1], xmax),
+                    min(self.axis_extents[2], ymin), max(self.axis_extents[3], ymax))
 
-        return np.amin(xmin_list), np.amax(xmax_list), np.amin(ymin_list), np.amax(ymax_list)
-    
     def graphWidget_plot_update(self):
-        self.graphPlotItem.clear()
-        for item in self.spectra_items:
+        # bring the plot area in line with spectra_items. Every item keeps its curve, so only the curves of removed items are removed,
+        # and only the curves whose pen or visibility changed are touched
+        self.graphWidget_remove_stale_curves()
+
+        if self.overlay_mode:
+            # long spectra keep their own level of detail curve
+            overlay_items = []
+            for item in self.spectra_items:
+                if item.spectra.wavenumber.shape[0] > self.lod_min_points:
+                    self.graphWidget_curve_update(item)
+                else:
+                    overlay_items.append(item)
+            self.graphWidget_overlay_update(overlay_items)
+        else:
+            for item in self.spectra_items:
+                self.graphWidget_curve_update(item)
+
+        self.plotted_items = [item for item in self.spectra_items if item.curve is not None]
+
+    def graphWidget_remove_stale_curves(self):
+        # remove the curves of the items no longer in spectra_items
+        item_ids = set(id(item) for item in self.spectra_items)
+        for item in self.plotted_items:
+            if id(item) not in item_ids and item.curve is not None:
+                self.graphPlotItem.removeItem(item.curve)
+                item.curve = None
+                item.curve_pen = None
+                item.curve_lod = None
+                item.curve_lod_view = None
+        self.plotted_items = [item for item in self.plotted_items if id(item) in item_ids]
+
+    def graphWidget_overlay_update(self, overlay_items):
+        # one curve per pen, the spectras concatenated into one path with the connect array breaking the line between spectras.
+        # A curve is only rebuilt when the spectras drawn with its pen changed
+        groups = {}
+        for item in overlay_items:
             if item.plot_bool:
-                a_x, a_y = item.spectra.get_spectra()
-                self.graphPlotItem.plot(a_x, a_y, pen=pg.mkPen(item.line_color, width = item.line_width))
+                groups.setdefault((item.line_color.rgba(), item.line_width), []).append(item)
+
+        for pen_key in list(self.overlay_curves):
+            if pen_key not in groups:
+                self.graphPlotItem.removeItem(self.overlay_curves.pop(pen_key)[1])
+
+        for pen_key, group in groups.items():
+            spectras = tuple(item.spectra for item in group)
+            overlay_curve = self.overlay_curves.get(pen_key)
+            if overlay_curve is not None and overlay_curve[0] == spectras:
+                continue
+
+            spectra_views = [spectra.get_spectra_view() for spectra in spectras]
+            x = np.concatenate([view[0] for view in spectra_views])
+            y = np.concatenate([view[1] for view in spectra_views])
+            connect = np.ones(x.shape[0], dtype = bool)
+            connect[np.cumsum([view[0].shape[0] for view in spectra_views]) - 1] = False
+
+            if overlay_curve is None:
+                curve = pg.PlotDataItem(pen = pg.mkPen(QColor.fromRgba(pen_key[0]), width = pen_key[1]))
+                self.graphPlotItem.addItem(curve)
+            else:
+                curve = overlay_curve[1]
+            curve.setData(x, y, connect = connect)
+            self.overlay_curves[pen_key] = (spectras, curve)
+
+    def set_overlay_mode(self, overlay_mode):
+        # switch between one curve per spectra and one curve per pen
+        self.overlay_mode = overlay_mode
+        if overlay_mode:
+            for item in self.plotted_items:
+                if item.curve_lod is None:
+                    self.graphPlotItem.removeItem(item.curve)
+                    item.curve = None
+                    item.curve_pen = None
+        else:
+            for spectras, curve in self.overlay_curves.values():
+                self.graphPlotItem.removeItem(curve)
+            self.overlay_curves = {}
+
+        self.graphWidget_plot_update()
 
+    def graphWidget_curve_update(self, item):
+        if item.curve is None:
+            if not item.plot_bool:
+                return # hidden items get a curve once they are shown
+            # the curve references read only views of the spectra arrays
+            wavenumber, intensity = item.spectra.get_spectra_view()
+            if wavenumber.shape[0] > self.lod_min_points:
+                item.curve_lod = Decimation_Pyramid(wavenumber, intensity)
+                item.curve = pg.PlotDataItem()
+            else:
+                item.curve = pg.PlotDataItem(wavenumber, intensity)
+            self.graphPlotItem.addItem(item.curve)
+
+        pen_key = (item.line_color.rgba(), item.line_width)
+        if item.curve_pen != pen_key:
+            item.curve.setPen(pg.mkPen(item.line_color, width = item.line_width))
+            item.curve_pen = pen_key
+
+        if item.curve.isVisible() != item.plot_bool:
+            item.curve.setVisible(item.plot_bool)
+
+        if item.curve_lod is not None and item.plot_bool:
+            self.graphWidget_lod_update(item)
+
+    def graphWidget_lod_update(self, item):
+        # the curve holds the level picked for the view, over the view and half a view on each side,
+        # so panning within that range and zooming that keeps the level do not touch the curve
+        x_min, x_max = self.graphViewBox.viewRange()[0]
+        level = item.curve_lod.get_level(x_min, x_max, self.graphViewBox.width())
+        view = item.curve_lod_view
+        if view is not None and view[0] == level and view[1] <= x_min and x_max <= view[2]:
+            return
+
+        margin = (x_max - x_min) / 2
+        item.curve.setData(*item.curve_lod.get_data(level, x_min - margin, x_max + margin))
+        item.curve_lod_view = (level, x_min - margin, x_max + margin)
+
+    def graphWidget_lod_update_all(self):
+        for item in self.plotted_items:
+            if item.curve_lod is not None and item.plot_bool:
+                self.graphWidget_lod_update(item)
 
     def graphWidget_set_x_limit(self, x_lower, x_higher):
         if x_lower is not None and x_higher is not None:
@@ -330,6 +778,7 @@ class sPyktro(QMainWindow, Ui_MainWindow):
             self.graphViewBox.setYRange(y_lower, y_higher, padding=0)
 
     def qtgraph_range_changed(self):
+        self.lod_timer.start()
         self.graphWidget.blockSignals(True)
         ax_x = self.graphPlotItem.getAxis("bottom")
         now_x_min = ax_x.range[0]
@@ -347,117 +796,98 @@ class sPyktro(QMainWindow, Ui_MainWindow):
 
         #self.history_update()
 
-    def listWidget_item_update(self):
-        # repopulate the listWidget
-        self.listWidget.blockSignals(True)
-        self.listWidget.clear()
-        self.listWidget.blockSignals(False)
-
-        for item in self.spectra_items:
-            sample_name = item.spectra.sample_name
-            q_item = QListWidgetItem(sample_name)
-            q_item.setCheckState(Qt.Checked)
-            self.listWidget.addItem(q_item)
-        
-        self.listWidget_color_update()
-
-    def listWidget_color_update(self):
-        # called wafter color_picker is called, and as listWidget item update is called
-        self.listWidget.blockSignals(True)
-        for i in range(self.get_spectra_nums()):
-            q_item = self.listWidget.item(i)
-            q_item.setForeground(self.spectra_items[i].line_color)
-        self.listWidget.blockSignals(False)
-
-    def listWidget_item_just_checked(self):
-        for i in range(self.get_spectra_nums()):
-            q_item = self.listWidget.item(i)
-            q_item_bool = (Qt.Checked == q_item.checkState())
-            self.spectra_items[i].plot_bool = q_item_bool
+    def listView_item_update(self):
+        # show a new spectra_items list in the list view, with the selection of the view taken from the items
+        self.spectra_model.set_items(self.spectra_items)
 
+        selection = QtCore.QItemSelection()
+        for i, item in enumerate(self.spectra_items):
+            if item.select_bool:
+                selection.select(self.spectra_model.index(i), self.spectra_model.index(i))
+        with QSignalBlocker(self.listView.selectionModel()):
+            self.listView.selectionModel().select(selection, QtCore.QItemSelectionModel.ClearAndSelect)
+
+    def listView_item_just_checked(self, row):
+        # the model has set plot_bool of the item, only its curve is updated
+        if self.spectra_items[row].plot_bool:
+            self.axis_extents_add([self.spectra_items[row]])
+        else:
+            self.axis_extents = None
         self.history_update()
-        self.graphWidget_plot_update()
-    
-    def listWidget_item_show(self):
-        self.listWidget.blockSignals(True)
-        for i in range(self.get_spectra_nums()):
-            if self.spectra_items[i].select_bool:
-                self.spectra_items[i].plot_bool = True
-                self.listWidget.item(i).setCheckState(Qt.Checked)
-
+        if self.overlay_mode:
+            self.graphWidget_plot_update()
+        else:
+            item = self.spectra_items[row]
+            had_curve = item.curve is not None
+            self.graphWidget_curve_update(item)
+            if not had_curve and item.curve is not None:
+                self.plotted_items.append(item)
+
+    def listView_set_plot_bool(self, plot_bool):
+        changed_rows = []
+        for i, item in enumerate(self.spectra_items):
+            if item.select_bool and item.plot_bool != plot_bool:
+                item.plot_bool = plot_bool
+                changed_rows.append(i)
+
+        self.spectra_model.rows_changed(changed_rows)
+        if plot_bool:
+            self.axis_extents_add([self.spectra_items[i] for i in changed_rows])
+        elif changed_rows:
+            self.axis_extents = None
         self.history_update()
         self.graphWidget_plot_update()
 
-        self.listWidget.blockSignals(False)
-
-    def listWidget_item_hide(self):
-        self.listWidget.blockSignals(True)
-        for i in range(self.get_spectra_nums()):
-            if self.spectra_items[i].select_bool:
-                self.spectra_items[i].plot_bool = False
-                self.listWidget.item(i).setCheckState(Qt.Unchecked)
+    def listView_item_show(self):
+        self.listView_set_plot_bool(True)
 
-        self.history_update()
-        self.graphWidget_plot_update()
-        
-        self.listWidget.blockSignals(False)
+    def listView_item_hide(self):
+        self.listView_set_plot_bool(False)
 
-    def listWidget_item_just_selected(self):
-        for i in range(self.get_spectra_nums()):
-            q_item = self.listWidget.item(i)
-            q_item_bool = q_item.isSelected()
-            self.spectra_items[i].select_bool = q_item_bool
-    
-    def listWidget_checkbox_update(self):
-        # when the check box state is not changed by the user.
-        # Because this update is presenting the current state instead of setting the current state,
-        # the signal should be blocked.
-        self.listWidget.blockSignals(True)
-        for i in range(self.get_spectra_nums()):
-            q_item = self.listWidget.item(i)
-            if self.spectra_items[i].plot_bool:
-                q_item.setCheckState(Qt.Checked)
-            else:
-                q_item.setCheckState(Qt.Unchecked)
-        self.listWidget.blockSignals(False)
+    def listView_item_just_selected(self, selected, deselected):
+        # only the rows in the selection change are visited
+        for index in deselected.indexes():
+            self.spectra_items[index.row()].select_bool = False
+        for index in selected.indexes():
+            self.spectra_items[index.row()].select_bool = True
 
     def delete_selected_spectras(self):
         new_spectra_items = []
         
         for item in self.spectra_items:
             if not item.select_bool:
-                new_spectra_items.append(item.copy())
+                new_spectra_items.append(item)
 
         self.spectra_items = new_spectra_items
+        self.axis_extents = None
 
         self.graphWidget_plot_update()
-        self.listWidget_item_update()
-        self.listWidget_checkbox_update()
+        self.listView_item_update()
         self.history_update()
 
     def duplicate_selected_spectras(self):
-        n = self.get_spectra_nums()
-
-        for i in range(n):
-            if self.spectra_items[i].select_bool:
-                self.spectra_items.append(self.spectra_items[i].copy())
+        new_items = [item.copy() for item in self.spectra_items if item.select_bool]
+        for item in new_items:
+            item.select_bool = False # the copies are not selected in the list view
+        self.spectra_model.append_items(new_items)
+        self.axis_extents_add(new_items)
 
         self.graphWidget_plot_update()
-        self.listWidget_item_update()
-        self.listWidget_checkbox_update()
         self.history_update()
         
                 
     def color_picker(self):
         color = QColorDialog.getColor()
         
-        for item in self.spectra_items:
+        changed_rows = []
+        for i, item in enumerate(self.spectra_items):
             if item.select_bool:
                 item.line_color = color
+                changed_rows.append(i)
         
         self.history_update()
         self.graphWidget_plot_update()
-        self.listWidget_color_update()
+        self.spectra_model.rows_changed(changed_rows)
 
     def set_line_width(self):
         line_window = Line_window()
@@ -486,12 +916,21 @@ class sPyktro(QMainWindow, Ui_MainWindow):
         now_y_min = ax_y.range[0]
         now_y_max = ax_y.range[1]
 
-        new_spectra_items = []
+        # each state is a tuple of item snapshots. Snapshots equal to the ones in the previous state are
+        # reused so consecutive states share them, and only the items whose attributes changed are recorded anew.
+        if self.history_states:
+            previous_snapshots = self.history_states[-1][0]
+        else:
+            previous_snapshots = ()
 
-        for item in self.spectra_items:
-            new_spectra_items.append(item.copy())
+        new_snapshots = []
+        for i, item in enumerate(self.spectra_items):
+            snapshot = item.snapshot()
+            if i < len(previous_snapshots) and previous_snapshots[i] == snapshot:
+                snapshot = previous_snapshots[i]
+            new_snapshots.append(snapshot)
 
-        self.history_states.append((new_spectra_items.copy(), (now_x_min, now_x_max, now_y_min, now_y_max)))
+        self.history_states.append((tuple(new_snapshots), (now_x_min, now_x_max, now_y_min, now_y_max)))
         self.history_which = self.history_which + 1
 
     
@@ -506,13 +945,24 @@ class sPyktro(QMainWindow, Ui_MainWindow):
             self.time_travel()
     
     def time_travel(self):
+        # the current items of the same spectra are reused with their curves, so only the differences to the state are redrawn
+        current_items = {}
+        for item in self.spectra_items:
+            current_items.setdefault(id(item.spectra), []).append(item)
+
         self.spectra_items = []
-        for item in self.history_states[self.history_which][0]:
-            self.spectra_items.append(item.copy())
+        for snapshot in self.history_states[self.history_which][0]:
+            same_spectra_items = current_items.get(id(snapshot[0]))
+            if same_spectra_items:
+                item = same_spectra_items.pop(0)
+                item.restore(snapshot)
+            else:
+                item = Spectra_item.from_snapshot(snapshot)
+            self.spectra_items.append(item)
+        self.axis_extents = None
 
         self.graphWidget_plot_update()
-        self.listWidget_item_update()
-        self.listWidget_checkbox_update()
+        self.listView_item_update()
 
         limit = self.history_states[self.history_which][1]
 
@@ -0,0 +1,244 @@
+import numpy as np
+from functools import lru_cache
+from scipy import sparse
+from scipy.linalg import get_lapack_funcs
+from scipy.special import expit
+from scipy.ndimage import minimum_filter1d, maximum_filter1d, uniform_filter1d
+
+# Baseline engines shared by Raman_Spectra and Spectra_Stack.
+# Every function takes a 1-D intensity or a (N, L) batch of same length spectra and returns the baseline in the same shape.
+
+
+@lru_cache(maxsize = 32)
+def penalty_band(L, lam, diff_order = 2):
+    '''
+    Penalty matrix lam * D.T D of the penalized least squares baselines, in the upper banded storage of LAPACK.
+    D is the difference matrix of order diff_order, so the penalty is symmetric with diff_order bands above the diagonal.
+    The band only depends on (L, lam, diff_order) and is cached, the caller adds the weights to the last row.
+
+    output
+        band: read only (diff_order + 1, L) array, band[diff_order + i - j, j] = penalty[i, j] for i <= j
+    '''
+    coefficients = np.diff(np.eye(diff_order + 1), diff_order, axis = 0)[0] # e.g. [1, -2, 1] for the second order
+    D = sparse.diags(coefficients, np.arange(diff_order + 1), shape = (L - diff_order, L), format = 'csr')
+    penalty = (lam * (D.T @ D)).todia()
+
+    band = np.zeros((diff_order + 1, L))
+    for k in range(diff_order + 1):
+        band[diff_order - k, k:] = penalty.diagonal(k)
+    band.flags.writeable = False
+    return band
+
+_pbsv = get_lapack_funcs('pbsv', dtype = np.float64)
+
+def solve_penalized(band, w, y):
+    # solve (W + penalty) z = W y with the banded Cholesky solver of LAPACK
+    ab = np.array(band)
+    ab[-1] += w
+    _, z, info = _pbsv(ab, w * y, lower = 0, overwrite_ab = 1, overwrite_b = 1)
+    if info != 0:
+        raise Exception("penalized least squares system is not positive definite, check the weights and lam")
+    return z
+
+def as_batch(intensity):
+    # (N, L) float view of a 1-D or 2-D intensity, and whether the input was 1-D
+    intensity = np.asarray(intensity, dtype = np.float64)
+    return np.atleast_2d(intensity), intensity.ndim == 1
+
+def from_batch(baseline, is_single):
+    return baseline[0] if is_single else baseline
+
+
+# Baseline Correction with Asymmetric Least Squares Smoothing, by P. Eilers and H. Boelens in 2005
+def als(intensity, lam = 100, p = 0.01, niter = 10):
+    '''
+    input
+        intensity: 1-D intensity or (N, L) batch of intensity
+        lam: smoothness
+        p: asymmetry
+        niter: number of iterations
+    '''
+    y, is_single = as_batch(intensity)
+    N, L = y.shape
+    band = penalty_band(L, float(lam))
+
+    baseline = np.empty_like(y)
+    for i in range(N):
+        w = np.ones(L)
+        for _ in range(niter):
+            z = solve_penalized(band, w, y[i])
+            w = p * (y[i] > z) + (1-p) * (y[i] < z)
+        baseline[i] = z
+
+    return from_batch(baseline, is_single)
+
+
+@lru_cache(maxsize = 32)
+def polynomial_basis(L, degree):
+    '''
+    Orthonormal basis of the polynomials of the given degree over x = np.arange(L).
+    The least squares polynomial fit of y is Q @ (Q.T @ y), so the projector is computed once per (L, degree)
+    and applied to a whole batch as two matrix products. x is mapped to [-1, 1] to keep the Vandermonde matrix well conditioned.
+
+    output
+        Q: read only (L, degree + 1) array
+    '''
+    Q, _ = np.linalg.qr(np.vander(np.linspace(-1, 1, L), degree + 1))
+    Q.flags.writeable = False
+    return Q
+
+
+# Automated Method for Subtraction of Fluorescence from Biological Raman Spectra, by Lieber & Mahadevan-Jansen (2003)
+# code is adapted from https://github.com/StatguyUser/BaselineRemoval/blob/master/src/BaselineRemoval.py
+def modpoly(intensity, degree = 2, repitition = 100, gradient = 0.001):
+    '''
+    input
+        intensity: 1-D intensity or (N, L) batch of intensity
+        degree: Polynomial degree, default is 2
+        repitition: How many iterations to run. Default is 100
+        gradient: Gradient for polynomial loss, default is 0.001. It measures incremental gain over each iteration. If gain in any iteration is less than this, further improvement will stop
+
+    output
+        the converged baseline, min(polynomial fit, intensity) of the last iteration
+    '''
+    y, is_single = as_batch(intensity)
+    N, L = y.shape
+    Q = polynomial_basis(L, degree)
+
+    y_work = y.copy()
+    active = np.arange(N) # rows which have not converged yet
+    nrep = 0
+    while active.size and nrep <= repitition:
+        y_old = y_work[active]
+        y_fit = (y_old @ Q) @ Q.T
+        y_new = np.minimum(y_fit, y[active])
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            criteria = np.sum(np.abs((y_new - y_old) / y_old), axis = 1)
+
+        y_work[active] = y_new
+        active = active[criteria >= gradient]
+        nrep = nrep + 1
+
+    return from_batch(y_work, is_single)
+
+
+# Baseline correction using asymmetrically reweighted penalized least squares smoothing, by S.-J. Baek et al. (2015)
+def arpls(intensity, lam = 1e5, ratio = 0.001, niter = 50):
+    '''
+    input
+        intensity: 1-D intensity or (N, L) batch of intensity
+        lam: smoothness
+        ratio: stop once the relative change of the weights is smaller than ratio
+        niter: maximum number of iterations
+    '''
+    y, is_single = as_batch(intensity)
+    N, L = y.shape
+    band = penalty_band(L, float(lam))
+
+    baseline = np.empty_like(y)
+    for i in range(N):
+        w = np.ones(L)
+        for _ in range(niter):
+            z = solve_penalized(band, w, y[i])
+            d = y[i] - z
+            d_negative = d[d < 0]
+            if d_negative.size < 2:
+                break
+            m = np.mean(d_negative)
+            s = np.std(d_negative)
+            if s == 0:
+                break
+            # generalized logistic function of the residual, written with expit so it never overflows
+            w_new = expit(-2 * (d - (2*s - m)) / s)
+            if np.linalg.norm(w - w_new) / np.linalg.norm(w) < ratio:
+                break
+            w = w_new
+        baseline[i] = z
+
+    return from_batch(baseline, is_single)
+
+
+# Baseline correction using adaptive iteratively reweighted penalized least squares, by Z.-M. Zhang et al. (2010)
+def airpls(intensity, lam = 100, niter = 15):
+    '''
+    input
+        intensity: 1-D intensity or (N, L) batch of intensity
+        lam: smoothness
+        niter: maximum number of iterations
+    '''
+    y, is_single = as_batch(intensity)
+    N, L = y.shape
+    band = penalty_band(L, float(lam))
+
+    baseline = np.empty_like(y)
+    for i in range(N):
+        y_i = y[i]
+        w = np.ones(L)
+        z = solve_penalized(band, w, y_i)
+        for t in range(1, niter):
+            d = y_i - z
+            negative = d < 0
+            dssn = np.abs(d[negative].sum())
+            if dssn == 0 or dssn < 0.001 * np.abs(y_i).sum():
+                break
+
+            w_new = np.zeros(L)
+            with np.errstate(over = 'ignore'):
+                w_new[negative] = np.exp(t * np.abs(d[negative]) / dssn)
+                w_new[0] = w_new[-1] = np.exp(t * np.abs(d[negative]).max() / dssn)
+            if not np.all(np.isfinite(w_new)): # the weights grow exponentially with the iteration
+                break
+            w = w_new
+            z = solve_penalized(band, w, y_i)
+        baseline[i] = z
+
+    return from_batch(baseline, is_single)
+
+
+# Statistics-sensitive non-linear iterative peak-clipping, by C. G. Ryan et al. (1988)
+def snip(intensity, max_half_window = 40, lls = True):
+    '''
+    input
+        intensity: 1-D intensity or (N, L) batch of intensity
+        max_half_window: largest clipping window, about the half width of the broadest peak in points
+        lls: clip in the log-log-square root space, which follows the baseline better under strong peaks
+    '''
+    y, is_single = as_batch(intensity)
+    L = y.shape[1]
+    max_half_window = min(int(max_half_window), (L - 1) // 2)
+
+    if lls:
+        v = np.log(np.log(np.sqrt(np.maximum(y, 0) + 1) + 1) + 1)
+    else:
+        v = y.copy()
+
+    # one vectorized pass over all spectra per window, O(L * max_half_window)
+    for p in range(1, max_half_window + 1):
+        mean = (v[:, :-2*p] + v[:, 2*p:]) / 2
+        np.minimum(v[:, p:-p], mean, out = v[:, p:-p])
+
+    if lls:
+        v = (np.exp(np.exp(v) - 1) - 1)**2 - 1
+        v = np.minimum(v, y) # the transform clips negative intensity at 0, keep the baseline under the spectra
+
+    return from_batch(v, is_single)
+
+
+def rolling_ball(intensity, half_window = 50, smooth_half_window = 0):
+    '''
+    Morphological opening (a rolling flat ball) of the spectra, optionally smoothed with a moving average.
+
+    input
+        intensity: 1-D intensity or (N, L) batch of intensity
+        half_window: half width of the ball in points, larger than the half width of the broadest peak
+        smooth_half_window: half width of the moving average applied to the opening. 0 for no smoothing
+    '''
+    y, is_single = as_batch(intensity)
+    window = 2 * int(half_window) + 1
+
+    # min and max filters run in O(L) per spectra regardless of the window
+    baseline = maximum_filter1d(minimum_filter1d(y, window, axis = 1, mode = 'nearest'), window, axis = 1, mode = 'nearest')
+    if smooth_half_window:
+        baseline = uniform_filter1d(baseline, 2 * int(smooth_half_window) + 1, axis = 1, mode = 'nearest')
+
+    return from_batch(baseline, is_single)
@@ -0,0 +1,101 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+
+class Spectra_File_Cache:
+    # On disk cache of parsed spectra files, stored as .npy. An entry is read into memory, only an entry over mmap_size bytes is memory mapped,
+    # since every memory map keeps a file descriptor open for as long as the spectra lives and a survey of thousands of spectra would hit the limit.
+    # An entry is keyed on the absolute path, size and modification time of the text file, so an edited file is parsed again.
+    # When the cache grows over max_size bytes, the least recently used entries are removed.
+
+    def __init__(self, cache_dir = None, max_size = 1024**3, mmap_size = 16 * 1024**2):
+        if cache_dir is None:
+            cache_dir = os.environ.get("SPYKTRO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "sPyktro"))
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.mmap_size = mmap_size
+        self.total_size = None # size of the cache directory, scanned once on the first save
+
+    def entry_path(self, file_path):
+        absolute_path = os.path.abspath(file_path)
+        file_stat = os.stat(absolute_path)
+        key = absolute_path + "|" + str(file_stat.st_size) + "|" + str(file_stat.st_mtime_ns)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+
+    def load(self, file_path):
+        # return the cached array read only, or None if the file is not cached
+        try:
+            entry_path = self.entry_path(file_path)
+            if os.path.getsize(entry_path) > self.mmap_size:
+                spectra_data = np.load(entry_path, mmap_mode = "r")
+            else:
+                spectra_data = np.load(entry_path)
+                spectra_data.flags.writeable = False
+        except (OSError, ValueError):
+            return None
+
+        try:
+            os.utime(entry_path) # the modification time of an entry is its last use, for the eviction
+        except OSError: # e.g. a read only cache directory, the entry is still valid
+            pass
+        return spectra_data
+
+    def save(self, file_path, spectra_data):
+        # a failure to write the cache never fails the load itself
+        try:
+            entry_path = self.entry_path(file_path)
+            os.makedirs(self.cache_dir, exist_ok = True)
+            # write to a temporary file first so other processes never map a partially written entry
+            file_descriptor, temp_path = tempfile.mkstemp(suffix = ".tmp", dir = self.cache_dir)
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                np.save(temp_file, np.ascontiguousarray(spectra_data))
+            entry_size = os.path.getsize(temp_path)
+            os.replace(temp_path, entry_path)
+        except OSError:
+            return
+
+        if self.total_size is None:
+            self.total_size = self.get_cache_size()
+        else:
+            self.total_size += entry_size
+
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def get_entries(self):
+        # list of (last use, size, path) of the cache entries
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".npy"):
+                        entry_stat = entry.stat()
+                        entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+
+    def get_cache_size(self):
+        return sum(entry[1] for entry in self.get_entries())
+
+    def evict(self, target_size = None):
+        # remove the least recently used entries until the cache is below target_size, 80% of max_size by default
+        if target_size is None:
+            target_size = int(self.max_size * 0.8)
+
+        entries = sorted(self.get_entries())
+        total_size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry_path in entries:
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError: # e.g. still mapped on Windows
+                continue
+            total_size -= entry_size
+        self.total_size = total_size
+
+    def clear(self):
+        self.evict(target_size = 0)
@@ -0,0 +1,274 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+from inspect import signature
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sPyktro_raman import Raman_Spectra
+from sPyktro_pipeline import Spectra_Pipeline, pipeline_steps
+
+# Command line batch processing of spectra files, without the GUI:
+#     python sPyktro_cli.py "spectra/*.txt" --recipe recipe.json --output results
+# Only numpy and scipy are imported, PySide6 and matplotlib are not, so it starts fast on compute nodes.
+#
+# A recipe is a json list of [name, parameters] steps, in the same form as the lineage of a Raman_Spectra, e.g.
+#     [["cut", {"start": 200, "end": 1800}],
+#      ["baseline_als", {"lam": 100000, "p": 0.01}],
+#      ["spectra_smoothing", {"filter_window": 11, "filter_degree": 3}],
+#      ["spectra_normalization", {"method": "max"}],
+#      ["find_raman_peaks", {"lower_prominance": 0.05}],
+#      ["fit_peaks", {"func": "multi_glsum", "start": 1200, "end": 1700, "guess": {"lower_prominance": 0.05}}]]
+# The processing steps between two analysis steps run as one Spectra_Pipeline over all spectra a worker gets,
+# find_raman_peaks and fit_peaks record their result for the spectra at that point.
+# fit_peaks takes either parameters and bounds, or guess with the peak_fitting_guess arguments to start from the detected peaks.
+
+processing_steps = pipeline_steps
+analysis_steps = ("find_raman_peaks", "fit_peaks")
+
+
+def load_recipe(path):
+    # list of (name, parameters) of a recipe file, checked before any spectra is processed
+    with open(path) as recipe_file:
+        steps = json.load(recipe_file)
+
+    recipe = []
+    for step in steps:
+        if not isinstance(step, list) or len(step) != 2 or not isinstance(step[1], dict):
+            raise Exception("A recipe step has to be [name, parameters], " + json.dumps(step) + " is not")
+        name, parameters = step
+        if name not in processing_steps and name not in analysis_steps:
+            raise Exception("Unknown recipe step " + str(name) + ", the steps are " + ", ".join(processing_steps + analysis_steps))
+        if name == "fit_peaks":
+            get_peak_model(parameters.get("func"))
+        recipe.append((name, parameters))
+    return recipe
+
+
+def get_peak_model(func_name):
+    # the multi peak model of Raman_Spectra with this name, e.g. multi_glsum
+    func = getattr(Raman_Spectra, str(func_name), None)
+    if func is None or getattr(func, "__func__", func) not in Raman_Spectra.get_peak_models():
+        raise Exception("func of fit_peaks has to be multi_gaussian, multi_lorentzian, multi_glsum, multi_voigt or multi_pseudo_voigt")
+    return func
+
+
+def find_input_files(inputs):
+    # files of a list of files, directories and glob patterns, in order and without duplicates
+    path_list = []
+    for path in inputs:
+        if os.path.isdir(path):
+            matches = sorted(os.path.join(path, name) for name in os.listdir(path) if os.path.isfile(os.path.join(path, name)))
+        else:
+            matches = sorted(glob.glob(path))
+        path_list.extend(matches)
+    return list(dict.fromkeys(path_list))
+
+
+def split_recipe(recipe):
+    # the recipe as Spectra_Pipeline of consecutive processing steps and (name, parameters) of the analysis steps between them
+    stages = []
+    for name, parameters in recipe:
+        if name in analysis_steps:
+            stages.append((name, parameters))
+        else:
+            if not stages or not isinstance(stages[-1], Spectra_Pipeline):
+                stages.append(Spectra_Pipeline())
+            stages[-1].add_step(name, parameters)
+    return stages
+
+
+def run_recipe(spectra_list, recipe):
+    '''
+    input
+        spectra_list: list of Raman_Spectra, processed together as one batch per raman shift
+        recipe: list of (name, parameters), see load_recipe
+
+    output
+        list of (spectra, peaks, fit_result, error) for each spectra
+            spectra: the processed Raman_Spectra, None if a step raised
+            peaks: (position, height, prominence) arrays of the last find_raman_peaks step, None if there is none
+            fit_result: Peak_Fit_Result of the last fit_peaks step, None if there is none or the fit failed
+            error: the exception a step raised for this spectra, the later steps are skipped for it. None if there is none
+    '''
+    spectra_list = list(spectra_list)
+    peaks_list = [None] * len(spectra_list)
+    fit_result_list = [None] * len(spectra_list)
+    error_list = [None] * len(spectra_list)
+    for stage in split_recipe(recipe):
+        active = [i for i in range(len(spectra_list)) if error_list[i] is None]
+        if isinstance(stage, Spectra_Pipeline):
+            try:
+                for i, new_spectra in zip(active, stage.run_spectra([spectra_list[i] for i in active])):
+                    spectra_list[i] = new_spectra
+            except Exception: # one spectra failed its batch, each spectra is run on its own to find it
+                for i in active:
+                    try:
+                        spectra_list[i] = stage.run_spectra([spectra_list[i]])[0]
+                    except Exception as x:
+                        spectra_list[i], error_list[i] = None, x
+            continue
+
+        name, parameters = stage
+        for i in active:
+            spectra = spectra_list[i]
+            try:
+                if name == "find_raman_peaks":
+                    peaks_index, properties = spectra.find_raman_peaks(**parameters)
+                    height = properties.get("peak_heights", spectra.intensity[peaks_index])
+                    peaks_list[i] = (spectra.wavenumber[peaks_index], height, properties["prominences"])
+
+                elif name == "fit_peaks":
+                    fit_parameters = dict(parameters)
+                    func = get_peak_model(fit_parameters.pop("func"))
+                    guess = fit_parameters.pop("guess", None)
+                    fit_result_list[i] = None
+                    if guess is not None:
+                        try:
+                            fit_parameters["parameters"], fit_parameters["bounds"] = spectra.peak_fitting_guess(func, fit_parameters["start"], fit_parameters["end"], **guess)
+                        except Exception: # no peak found between start and end to start the fit from
+                            continue
+                    try:
+                        fit_result_list[i] = spectra.fit_peaks(func, **fit_parameters)
+                    except (RuntimeError, ValueError): # no convergence within maxfev, or non finite values
+                        pass
+            except Exception as x:
+                spectra_list[i], error_list[i] = None, x
+
+    return list(zip(spectra_list, peaks_list, fit_result_list, error_list))
+
+
+def process_files(task):
+    # runs in a worker process. The files of a task are processed as one batch, only arrays and the fit results are sent back
+    path_list, recipe = task
+    results = [None] * len(path_list)
+    loaded = []
+    for i, path in enumerate(path_list):
+        sample_name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            loaded.append((i, Raman_Spectra(path, sample_name)))
+        except Exception as x:
+            results[i] = (sample_name, None, None, None, None, type(x).__name__ + " raised while loading " + path + ": " + str(x))
+
+    batch_results = run_recipe([spectra for _, spectra in loaded], recipe)
+    for (i, spectra), (new_spectra, peaks, fit_result, error) in zip(loaded, batch_results):
+        if error is not None:
+            results[i] = (spectra.sample_name, None, None, None, None, type(error).__name__ + " raised while processing " + path_list[i] + ": " + str(error))
+        else:
+            results[i] = (spectra.sample_name, np.asarray(new_spectra.wavenumber), np.asarray(new_spectra.intensity), peaks, fit_result, None)
+    return results
+
+
+def run_batch(path_list, recipe, max_workers = None, chunk_size = 256):
+    # process_files over chunks of at most chunk_size paths, on a process pool if there is more than one worker.
+    # Results are in the order of path_list
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers > 1:
+        chunk_size = max(1, min(chunk_size, int(np.ceil(len(path_list) / (4 * max_workers)))))
+    tasks = [(path_list[i:i+chunk_size], recipe) for i in range(0, len(path_list), chunk_size)]
+
+    if max_workers == 1 or len(tasks) < 2:
+        chunk_results = map(process_files, tasks)
+        return [result for results in chunk_results for result in results]
+
+    with ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context("spawn")) as executor:
+        return [result for results in executor.map(process_files, tasks) for result in results]
+
+
+def write_spectra(path, results):
+    # processed spectra as npz. Spectra sharing one raman shift are stored as one (N, L) intensity array, as separate arrays otherwise
+    sample_names = np.array([result[0] for result in results])
+    wavenumber = results[0][1]
+    if all(result[1].shape == wavenumber.shape and np.array_equal(result[1], wavenumber) for result in results):
+        np.savez(path, sample_names = sample_names, wavenumber = wavenumber, intensity = np.stack([result[2] for result in results]))
+    else:
+        arrays = {}
+        for i, result in enumerate(results):
+            arrays["wavenumber_" + str(i)] = result[1]
+            arrays["intensity_" + str(i)] = result[2]
+        np.savez(path, sample_names = sample_names, **arrays)
+
+
+def write_peaks(path, results):
+    # one row per peak
+    with open(path, "w", newline = "") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["sample_name", "position", "height", "prominence"])
+        for sample_name, _, _, peaks, _, _ in results:
+            if peaks is not None:
+                for position, height, prominence in zip(*peaks):
+                    writer.writerow([sample_name, position, height, prominence])
+
+
+def write_fits(path, results, func):
+    # one row per fitted peak, so the spectra can have a different number of guessed peaks. A spectra that could not be fitted
+    # is one row with success 0
+    func_para_num, peak_function = Raman_Spectra.get_peak_models()[getattr(func, "__func__", func)][:2]
+    parameter_names = list(signature(peak_function).parameters)[1:]
+    with open(path, "w", newline = "") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["sample_name", "success", "nfev", "fit_time", "peak"] + parameter_names + [name + "_err" for name in parameter_names] + ["area"])
+        for sample_name, _, _, _, fit_result, _ in results:
+            if fit_result is None:
+                writer.writerow([sample_name, 0, 0, 0.0, ""] + [""] * (2 * func_para_num + 1))
+                continue
+            popt = fit_result.popt.reshape(-1, func_para_num)
+            perr = fit_result.perr.reshape(-1, func_para_num)
+            for k in range(popt.shape[0]):
+                area = fit_result.peak_areas[k] if fit_result.peak_areas is not None else ""
+                writer.writerow([sample_name, 1, fit_result.nfev, fit_result.fit_time, k + 1] + popt[k].tolist() + perr[k].tolist() + [area])
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "sPyktro_cli", description = "Process raman spectra files with a recipe, without the GUI.")
+    parser.add_argument("inputs", nargs = "+", help = "spectra files, directories or glob patterns")
+    parser.add_argument("-r", "--recipe", required = True, help = "json file of the processing steps")
+    parser.add_argument("-o", "--output", default = "sPyktro_output", help = "directory of the result files (default: sPyktro_output)")
+    parser.add_argument("-j", "--workers", type = int, default = None, help = "number of worker processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    try:
+        recipe = load_recipe(args.recipe)
+    except Exception as x:
+        print("Error in the recipe " + args.recipe + ": " + str(x), file = sys.stderr)
+        return 2
+
+    path_list = find_input_files(args.inputs)
+    if not path_list:
+        print("No spectra files found for " + " ".join(args.inputs), file = sys.stderr)
+        return 2
+
+    run_time = time.perf_counter()
+    results = run_batch(path_list, recipe, max_workers = args.workers)
+    run_time = time.perf_counter() - run_time
+
+    errors = [result[5] for result in results if result[5] is not None]
+    results = [result for result in results if result[5] is None]
+    for error in errors:
+        print(error, file = sys.stderr)
+
+    try:
+        os.makedirs(args.output, exist_ok = True)
+        if results:
+            write_spectra(os.path.join(args.output, "spectra.npz"), results)
+            if any(name == "find_raman_peaks" for name, _ in recipe):
+                write_peaks(os.path.join(args.output, "peaks.csv"), results)
+            if any(name == "fit_peaks" for name, _ in recipe):
+                fit_steps = [parameters for name, parameters in recipe if name == "fit_peaks"]
+                write_fits(os.path.join(args.output, "fits.csv"), results, get_peak_model(fit_steps[-1]["func"]))
+    except OSError as x:
+        print(type(x).__name__ + " raised while writing the results to " + args.output + ": " + str(x), file = sys.stderr)
+        return 1
+
+    print("Processed " + str(len(results)) + " of " + str(len(path_list)) + " spectra in " + str(round(run_time, 2)) + " s, results in " + args.output)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import os
+import csv
+import multiprocessing
+from inspect import signature
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sPyktro_raman import Raman_Spectra
+
+
+def fit_peak_series(series, func, parameters, bounds = None, warm_start = True, maxfev = 10000):
+    '''
+    Fit the same peak model to a series of spectra one after the other.
+    With warm_start, each fit starts from the popt of the previous spectra in the series, and falls back to parameters if that fit fails.
+
+    input
+        series: list of (sample_name, x, y) of the fitting range of each spectra
+        func, parameters, bounds, maxfev: see Raman_Spectra.fit_peaks
+
+    output
+        list of Peak_Fit_Result, None for a spectra that could not be fitted
+    '''
+    if bounds is not None:
+        lower_bounds, upper_bounds = np.broadcast_arrays(np.asarray(bounds[0], dtype = float), np.asarray(bounds[1], dtype = float))
+
+    fit_results = []
+    previous_popt = None
+    for sample_name, x, y in series:
+        if warm_start and previous_popt is not None:
+            start_list = [previous_popt, parameters]
+        else:
+            start_list = [parameters]
+
+        fit_result = None
+        for p0 in start_list:
+            if bounds is not None and p0 is not None:
+                p0 = np.clip(p0, lower_bounds, upper_bounds)
+            try:
+                fit_result = Raman_Spectra.fit_peak_arrays(x, y, func, parameters = p0, bounds = bounds, maxfev = maxfev, sample_name = sample_name)
+            except (RuntimeError, ValueError): # no convergence within maxfev, or non finite values
+                continue
+            break
+
+        fit_results.append(fit_result)
+        if fit_result is not None:
+            previous_popt = fit_result.popt
+
+    return fit_results
+
+
+def batch_peak_fitting(spectra_list, func, start, end, parameters, bounds = None, warm_start = True, max_workers = None, maxfev = 10000):
+    '''
+    Fit the same peak model to many spectra, e.g. a time series or the pixels of a map, on a process pool.
+    The spectra are split into contiguous chunks, one task per chunk, and each chunk is fitted with fit_peak_series
+    so the fits along the series warm start from their neighbour.
+    func has to be picklable, e.g. Raman_Spectra.multi_glsum, and scripts have to guard their entry point with if __name__ == '__main__'.
+
+    input
+        spectra_list: list of Raman_Spectra, in series order
+        func, start, end, parameters, bounds, maxfev: see Raman_Spectra.fit_peaks
+        warm_start: start each fit from the result of the previous spectra
+        max_workers: number of worker processes. Default is the number of cores, 1 fits in this process
+
+    output
+        a Peak_Fit_Table
+    '''
+    # only the fitting range of each spectra is sent to the workers
+    series = []
+    for rs in spectra_list:
+        start_index = np.argmin(np.abs(rs.wavenumber - start))
+        end_index = np.argmin(np.abs(rs.wavenumber - end))
+        series.append((rs.sample_name, np.asarray(rs.wavenumber[start_index:end_index]), np.asarray(rs.intensity[start_index:end_index])))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers == 1 or len(series) < 2 * max_workers:
+        fit_results = fit_peak_series(series, func, parameters, bounds = bounds, warm_start = warm_start, maxfev = maxfev)
+    else:
+        # a few chunks per worker keeps the pool busy while most fits still have a warm start
+        chunk_size = int(np.ceil(len(series) / (4 * max_workers)))
+        chunks = [series[i:i+chunk_size] for i in range(0, len(series), chunk_size)]
+
+        fit_results = []
+        with ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(fit_peak_series, chunk, func, parameters, bounds, warm_start, maxfev) for chunk in chunks]
+            for future in futures:
+                fit_results.extend(future.result())
+
+    return Peak_Fit_Table.from_fit_results([rs.sample_name for rs in spectra_list], fit_results, func)
+
+
+class Peak_Fit_Table:
+    # fitted parameters of many spectra as one row per spectra. Failed fits are rows of nan with success False
+
+    def __init__(self, sample_names, parameter_names, popt, perr, peak_areas, nfev, fit_time, success):
+        self.sample_names = sample_names
+        self.parameter_names = parameter_names
+        self.popt = popt # (N, P)
+        self.perr = perr # (N, P) one standard deviation error of popt
+        self.peak_areas = peak_areas # (N, K) or None if the model has no known peak area
+        self.nfev = nfev # (N,) number of function evaluations
+        self.fit_time = fit_time # (N,) wall time of curve_fit in seconds
+        self.success = success # (N,) bool
+
+    @classmethod
+    def from_fit_results(cls, sample_names, fit_results, func):
+        first_result = next((fit_result for fit_result in fit_results if fit_result is not None), None)
+        if first_result is None:
+            raise Exception("None of the spectra could be fitted")
+
+        parameter_num = first_result.popt.shape[0]
+        parameter_names = cls.get_parameter_names(func, parameter_num)
+
+        N = len(fit_results)
+        popt = np.full((N, parameter_num), np.nan)
+        perr = np.full((N, parameter_num), np.nan)
+        nfev = np.zeros(N, dtype = int)
+        fit_time = np.zeros(N)
+        success = np.zeros(N, dtype = bool)
+        if first_result.peak_areas is not None:
+            peak_areas = np.full((N, len(first_result.peak_areas)), np.nan)
+        else:
+            peak_areas = None
+
+        for i, fit_result in enumerate(fit_results):
+            if fit_result is None:
+                continue
+            popt[i] = fit_result.popt
+            perr[i] = fit_result.perr
+            nfev[i] = fit_result.nfev
+            fit_time[i] = fit_result.fit_time
+            success[i] = True
+            if peak_areas is not None:
+                peak_areas[i] = fit_result.peak_areas
+
+        return cls(list(sample_names), parameter_names, popt, perr, peak_areas, nfev, fit_time, success)
+
+    @staticmethod
+    def get_parameter_names(func, parameter_num):
+        # e.g. mu_1, FWHM_1, amp_1, l_weight_1, mu_2, ... for the multi peak models, p_0, p_1, ... otherwise
+        peak_model = Raman_Spectra.get_peak_models().get(getattr(func, "__func__", func))
+        if peak_model is None:
+            return ["p_" + str(i) for i in range(parameter_num)]
+
+        func_para_num, peak_function = peak_model[0], peak_model[1]
+        names = list(signature(peak_function).parameters)[1:]
+        return [names[i % func_para_num] + "_" + str(i // func_para_num + 1) for i in range(parameter_num)]
+
+    def __len__(self):
+        return len(self.sample_names)
+
+    def __str__(self):
+        return "Peak_Fit_Table of " + str(len(self)) + " spectra, " + str(int(np.sum(self.success))) + " fitted"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def to_csv(self, path):
+        header = ["sample_name", "success", "nfev", "fit_time"] + self.parameter_names + [name + "_err" for name in self.parameter_names]
+        if self.peak_areas is not None:
+            header += ["area_" + str(i + 1) for i in range(self.peak_areas.shape[1])]
+
+        with open(path, "w", newline = "") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            for i in range(len(self)):
+                row = [self.sample_names[i], int(self.success[i]), self.nfev[i], self.fit_time[i]] + self.popt[i].tolist() + self.perr[i].tolist()
+                if self.peak_areas is not None:
+                    row += self.peak_areas[i].tolist()
+                writer.writerow(row)
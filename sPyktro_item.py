@@ -20,7 +20,106 @@ class Spectra_item():
         self.plot_bool = plot_bool
         self.select_bool = select_bool
 
+        # the curve of the item in the plot area, created by the main window the first time the item is plotted,
+        # and the (rgba, width) of the pen it is drawn with
+        self.curve = None
+        self.curve_pen = None
+
+        # Decimation_Pyramid of a long spectra and the (level, x_min, x_max) of the data the curve currently holds
+        self.curve_lod = None
+        self.curve_lod_view = None
+
     def copy(self):
         return Spectra_item(self.spectra.copy(), QColor(self.line_color), 
             line_width = self.line_width, plot_bool = self.plot_bool, select_bool = self.select_bool)
 
+    def snapshot(self):
+        # an immutable record of the item for the undo history.
+        # The spectra object is shared between history states and never copied or re-read from disk,
+        # only the plotting attributes are recorded.
+        return (self.spectra, self.line_color.rgba(), self.line_width, self.plot_bool, self.select_bool)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        spectra, line_rgba, line_width, plot_bool, select_bool = snapshot
+        return cls(spectra, QColor.fromRgba(line_rgba), line_width = line_width, plot_bool = plot_bool, select_bool = select_bool)
+
+    def restore(self, snapshot):
+        # set the plotting attributes back to a snapshot of the same spectra, keeping the curve of the item
+        spectra, line_rgba, line_width, plot_bool, select_bool = snapshot
+        self.spectra = spectra
+        self.line_color = QColor.fromRgba(line_rgba)
+        self.line_width = line_width
+        self.plot_bool = plot_bool
+        self.select_bool = select_bool
+
+
+class Spectra_List_Model(QtCore.QAbstractListModel):
+    # list model over the spectra items of the main window. The view only asks for the rows it shows,
+    # and changes are reported with dataChanged for the changed rows only.
+    # items is the same list object as the spectra_items of the main window, rows are added with append_items
+    # and a new list is set with set_items, so the model always knows about the change
+
+    check_changed = QtCore.Signal(int) # row of an item checked or unchecked in the view
+
+    def __init__(self, items = None, parent = None):
+        super().__init__(parent)
+        self.items = items if items is not None else []
+
+    def rowCount(self, parent = QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.items)
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        item = self.items[index.row()]
+        if role == Qt.DisplayRole:
+            return item.spectra.sample_name
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if item.plot_bool else Qt.Unchecked
+        if role == Qt.ForegroundRole:
+            return QtGui.QBrush(item.line_color)
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role = Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+
+        item = self.items[index.row()]
+        plot_bool = Qt.CheckState(value) == Qt.Checked
+        if item.plot_bool != plot_bool:
+            item.plot_bool = plot_bool
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+            self.check_changed.emit(index.row())
+        return True
+
+    def set_items(self, items):
+        self.beginResetModel()
+        self.items = items
+        self.endResetModel()
+
+    def append_items(self, new_items):
+        if not new_items:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.items), len(self.items) + len(new_items) - 1)
+        self.items.extend(new_items)
+        self.endInsertRows()
+
+    def rows_changed(self, rows):
+        # one dataChanged per run of consecutive rows
+        rows = sorted(rows)
+        i = 0
+        while i < len(rows):
+            j = i
+            while j + 1 < len(rows) and rows[j + 1] == rows[j] + 1:
+                j = j + 1
+            self.dataChanged.emit(self.index(rows[i]), self.index(rows[j]))
+            i = j + 1
@@ -0,0 +1,217 @@
+import io
+import os
+import time
+import socket
+import threading
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+
+
+class Ring_Buffer:
+    # the last capacity spectra of an acquisition as one preallocated (capacity, L) array. A new spectra overwrites the oldest row,
+    # so adding a spectra and reading the buffer cost the same after one hour as after one minute.
+    # The sources write from their thread and the GUI reads, both under lock.
+
+    def __init__(self, capacity = 500):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.wavenumber = None # raman shift of the first spectra, the later ones are interpolated on it if they differ
+        self.data = None # (capacity, L), allocated with the first spectra
+        self.times = np.zeros(capacity) # time.time() each row was written
+        self.names = [None] * capacity
+        self.head = 0 # row the next spectra is written to
+        self.count = 0 # number of spectra received since the start, not capped at capacity
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, wavenumber, intensity, name):
+        with self.lock:
+            if self.data is None:
+                self.wavenumber = np.array(wavenumber)
+                self.data = np.zeros((self.capacity, self.wavenumber.shape[0]))
+
+            if wavenumber.shape != self.wavenumber.shape or not np.array_equal(wavenumber, self.wavenumber):
+                if wavenumber[0] > wavenumber[-1]: # np.interp needs an increasing raman shift
+                    wavenumber, intensity = wavenumber[::-1], intensity[::-1]
+                intensity = np.interp(self.wavenumber, wavenumber, intensity)
+
+            self.data[self.head] = intensity
+            self.times[self.head] = time.time()
+            self.names[self.head] = name
+            self.head = (self.head + 1) % self.capacity
+            self.count += 1
+
+    def get_latest(self):
+        # (wavenumber, intensity, name) copies of the newest spectra, None if there is none yet
+        with self.lock:
+            if self.count == 0:
+                return None
+            latest = (self.head - 1) % self.capacity
+            return self.wavenumber, self.data[latest].copy(), self.names[latest]
+
+    def get_ordered(self):
+        # (len(self), L) copy of the buffer from the oldest to the newest spectra, the rows of the waterfall
+        with self.lock:
+            if self.count < self.capacity:
+                return self.data[:self.count].copy()
+            return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+
+class Live_Source(QThread):
+    # a thread receiving spectra during an acquisition and adding them to a Ring_Buffer. buffer_updated is emitted after each spectra,
+    # the GUI coalesces the signals into one redraw per timer interval
+
+    buffer_updated = Signal(int) # number of spectra received so far
+    receive_failed = Signal(str) # error message of a spectra that could not be parsed
+
+    def __init__(self, ring_buffer):
+        super().__init__()
+        self.ring_buffer = ring_buffer
+        self.stop_bool = False
+
+    def stop(self):
+        self.stop_bool = True
+
+    def add_spectra_data(self, spectra_data, name):
+        if spectra_data.ndim != 2 or spectra_data.shape[1] < 2 or spectra_data.shape[0] < 2:
+            self.receive_failed.emit(name + " is not a spectra of two columns")
+            return
+        self.ring_buffer.append(spectra_data[:, 0], spectra_data[:, 1], name)
+        self.buffer_updated.emit(self.ring_buffer.count)
+
+
+class Live_Directory_Watcher(Live_Source):
+    # poll a directory for new spectra files. A file is parsed once its size is the same in two polls, so a file still being written
+    # is not read half way. Files in the directory before the start are skipped.
+    # Instead of the names of all the files seen, the watcher keeps the newest modification time it has read and the names at that time,
+    # older files are skipped after their stat. A file copied in with an older modification time is therefore missed.
+    # A poll only stats the directory and the pending files while the directory is unchanged. The directory is listed, a stat per entry,
+    # only when its own modification time changed, i.e. a file was added, removed or renamed, so the cost of a quiet poll stays flat
+
+    def __init__(self, ring_buffer, directory, interval = 0.1):
+        super().__init__(ring_buffer)
+        self.directory = directory
+        self.interval = interval
+        self.last_mtime = -1 # st_mtime_ns of the newest file read
+        self.last_names = set() # names of the files read with st_mtime_ns equal to last_mtime
+        self.pending_sizes = {} # name -> size of a new file at the last poll
+        self.directory_mtime = None # st_mtime_ns of the directory at the last listing
+        self.list_time = 0 # time.time_ns() at the start of the last listing
+
+    def list_new_files(self):
+        # (st_mtime_ns, name, size) of the files newer than the last read file, and of the pending files
+        new_files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError as x: # e.g. deleted between scandir and stat
+                    self.receive_failed.emit(type(x).__name__ + " raised while listing " + entry.name)
+                    continue
+                if stat.st_mtime_ns > self.last_mtime or entry.name in self.pending_sizes \
+                        or (stat.st_mtime_ns == self.last_mtime and entry.name not in self.last_names):
+                    new_files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        return new_files
+
+    def get_new_files(self):
+        # list the directory if it changed since the last listing, otherwise only stat the pending files
+        directory_mtime = os.stat(self.directory).st_mtime_ns
+        # a file added in the same clock tick as the last listing does not change the modification time, list again while it is that recent
+        if directory_mtime != self.directory_mtime or directory_mtime >= self.list_time - 10**9:
+            self.directory_mtime = directory_mtime
+            self.list_time = time.time_ns()
+            return self.list_new_files()
+
+        new_files = []
+        for name in self.pending_sizes:
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError as x:
+                self.receive_failed.emit(type(x).__name__ + " raised while listing " + name)
+                continue
+            new_files.append((stat.st_mtime_ns, name, stat.st_size))
+        return new_files
+
+    def set_read(self, name, mtime):
+        if mtime > self.last_mtime:
+            self.last_mtime = mtime
+            self.last_names = {name}
+        elif mtime == self.last_mtime:
+            self.last_names.add(name)
+
+    def run(self):
+        try:
+            for mtime, name, _ in self.list_new_files():
+                self.set_read(name, mtime)
+        except OSError as x:
+            self.receive_failed.emit(type(x).__name__ + " raised while listing " + self.directory)
+
+        while not self.stop_bool:
+            try:
+                new_files = self.get_new_files()
+            except OSError as x: # the directory was removed or is not reachable, try again at the next poll
+                self.receive_failed.emit(type(x).__name__ + " raised while listing " + self.directory)
+                new_files = []
+
+            pending_sizes = {}
+            for mtime, name, size in sorted(new_files):
+                if size == 0 or self.pending_sizes.get(name) != size:
+                    pending_sizes[name] = size
+                    continue
+
+                self.set_read(name, mtime)
+                try:
+                    spectra_data = np.loadtxt(os.path.join(self.directory, name), encoding = 'cp1252')
+                except (UnicodeDecodeError, ValueError, OSError) as x:
+                    self.receive_failed.emit(type(x).__name__ + " raised while reading " + name)
+                    continue
+                self.add_spectra_data(spectra_data, os.path.splitext(name)[0])
+            self.pending_sizes = pending_sizes # a pending file removed from the directory is dropped
+
+            time.sleep(self.interval)
+
+
+class Live_Socket_Receiver(Live_Source):
+    # listen on a local TCP port. Each connection sends one spectra as the text of a spectra file, two columns, and closes
+    # the connection when the spectra is complete
+
+    def __init__(self, ring_buffer, port, host = "127.0.0.1"):
+        super().__init__(ring_buffer)
+        self.host = host
+        self.port = port
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.1) # accept wakes up to check stop_bool
+
+    def run(self):
+        try:
+            while not self.stop_bool:
+                try:
+                    connection, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+
+                with connection:
+                    connection.settimeout(5)
+                    chunks = []
+                    try:
+                        while True:
+                            chunk = connection.recv(65536)
+                            if not chunk:
+                                break
+                            chunks.append(chunk)
+                    except OSError as x:
+                        self.receive_failed.emit(type(x).__name__ + " raised while receiving a spectra")
+                        continue
+
+                name = "live " + str(self.ring_buffer.count + 1)
+                try:
+                    spectra_data = np.loadtxt(io.StringIO(b"".join(chunks).decode('cp1252')))
+                except (UnicodeDecodeError, ValueError) as x:
+                    self.receive_failed.emit(type(x).__name__ + " raised while reading " + name)
+                    continue
+                self.add_spectra_data(spectra_data, name)
+        finally:
+            self.server.close()
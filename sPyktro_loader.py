@@ -0,0 +1,86 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PySide6.QtCore import QThread, Signal
+from sPyktro_raman import Raman_Spectra
+
+
+def parse_spectra_file(file_path):
+    # runs in a worker process. Only the parsed array is sent back, the Raman_Spectra is built in the GUI process.
+    try:
+        return Raman_Spectra.load_file(file_path), None
+    except (UnicodeDecodeError, ValueError, OSError) as x:
+        return None, type(x).__name__ + " raised while initializing " + os.path.basename(file_path)
+
+
+class Raman_Spectra_Loader(QThread):
+    # parse many spectra files off the GUI thread and hand them over in batches.
+    # Files are parsed on a process pool, np.loadtxt holds the GIL so threads would not run in parallel.
+
+    batch_loaded = Signal(list) # list of new Raman_Spectra, in the order of path_list
+    progress = Signal(int) # number of files handled so far
+    load_failed = Signal(str) # error message of a file that could not be parsed
+
+    pool_threshold = 32 # smaller loads are parsed on the loader thread, a pool is not worth its start up time
+
+    def __init__(self, path_list, sample_name_list, start_list, end_list, batch_size = 100, max_workers = None):
+        super().__init__()
+        self.path_list = path_list
+        self.sample_name_list = sample_name_list
+        self.start_list = start_list
+        self.end_list = end_list
+        self.batch_size = batch_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+        self.cancel_bool = False
+
+    def cancel(self):
+        self.cancel_bool = True
+
+    def run(self):
+        # files already in the binary cache are memory mapped here, only the others are sent to the pool
+        cached_data_list = []
+        parse_path_list = []
+        for path in self.path_list:
+            spectra_data = None
+            if Raman_Spectra.file_cache is not None:
+                spectra_data = Raman_Spectra.file_cache.load(path)
+            if spectra_data is None:
+                parse_path_list.append(path)
+            cached_data_list.append(spectra_data)
+
+        n = len(parse_path_list)
+        if n >= self.pool_threshold and self.max_workers > 1:
+            executor = ProcessPoolExecutor(max_workers = self.max_workers, mp_context = multiprocessing.get_context("spawn"))
+            chunksize = max(1, min(32, n // (4 * self.max_workers)))
+            parse_results = executor.map(parse_spectra_file, parse_path_list, chunksize = chunksize)
+        else:
+            executor = None
+            parse_results = map(parse_spectra_file, parse_path_list)
+
+        results = ((spectra_data, None) if spectra_data is not None else next(parse_results) for spectra_data in cached_data_list)
+
+        batch = []
+        try:
+            for i, (spectra_data, error) in enumerate(results):
+                if self.cancel_bool:
+                    break
+
+                if error is None:
+                    try:
+                        batch.append(Raman_Spectra(self.path_list[i], self.sample_name_list[i], start = self.start_list[i], end = self.end_list[i], spectra_data = spectra_data))
+                    except (IndexError, ValueError) as x: # parsed, but not two columns of raman shift and intensity
+                        error = type(x).__name__ + " raised while initializing " + os.path.basename(self.path_list[i])
+                if error is not None:
+                    self.load_failed.emit(error)
+
+                if len(batch) >= self.batch_size:
+                    self.batch_loaded.emit(batch)
+                    batch = []
+                self.progress.emit(i + 1)
+        finally:
+            # the spectra loaded before an error are still handed over
+            if batch:
+                self.batch_loaded.emit(batch)
+            if executor is not None:
+                executor.shutdown(wait = not self.cancel_bool, cancel_futures = True)
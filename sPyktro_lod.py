@@ -0,0 +1,59 @@
+import numpy as np
+
+
+class Decimation_Pyramid:
+    # min/max decimation of a long spectra at block sizes factor, factor**2, ... until a level has about min_points blocks.
+    # A block is drawn as its min and max at the block center, a vertical segment, so peaks narrower than a pixel stay visible.
+    # The levels are built once, picking a level and the visible blocks for a view is two searchsorted calls.
+
+    def __init__(self, x, y, factor = 4, min_points = 512):
+        '''
+        input
+            x: 1-D raman shift, increasing or decreasing
+            y: 1-D intensity
+            factor: number of blocks of a level merged into one block of the next level
+            min_points: no level is built with fewer blocks than this
+        '''
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if x.shape[0] > 1 and x[0] > x[-1]: # searchsorted needs an increasing x, the drawing order does not matter
+            x = x[::-1]
+            y = y[::-1]
+
+        # level 0 is the spectra itself, one point per block
+        self.block_sizes = [1]
+        self.centers = [x]
+        self.levels = [(x, y)]
+
+        block_x, block_min, block_max = x, y, y
+        block_size = 1
+        while block_min.shape[0] >= factor * min_points:
+            starts = np.arange(0, block_min.shape[0], factor)
+            block_x = np.add.reduceat(block_x, starts) / np.diff(np.append(starts, block_x.shape[0]))
+            block_min = np.minimum.reduceat(block_min, starts)
+            block_max = np.maximum.reduceat(block_max, starts)
+            block_size = block_size * factor
+
+            self.block_sizes.append(block_size)
+            self.centers.append(block_x)
+            self.levels.append((np.repeat(block_x, 2), np.column_stack((block_min, block_max)).ravel()))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def get_level(self, x_min, x_max, pixel_width):
+        # the coarsest level with at least one block per pixel between x_min and x_max
+        x = self.centers[0]
+        visible_points = np.searchsorted(x, x_max, side = 'right') - np.searchsorted(x, x_min, side = 'left')
+        largest_block = max(visible_points / max(pixel_width, 1), 1)
+        return int(np.searchsorted(self.block_sizes, largest_block, side = 'right')) - 1
+
+    def get_data(self, level, x_min, x_max):
+        # x, y of a level between x_min and x_max, with one more block on each side so the line runs to the edge of the view
+        centers = self.centers[level]
+        start = max(int(np.searchsorted(centers, x_min, side = 'left')) - 1, 0)
+        end = min(int(np.searchsorted(centers, x_max, side = 'right')) + 1, centers.shape[0])
+
+        points_per_block = 1 if level == 0 else 2
+        x, y = self.levels[level]
+        return x[start*points_per_block:end*points_per_block], y[start*points_per_block:end*points_per_block]
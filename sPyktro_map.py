@@ -0,0 +1,289 @@
+import os
+import weakref
+import tempfile
+import numpy as np
+from scipy.integrate import trapezoid
+from sPyktro_raman import Raman_Spectra
+from sPyktro_stack import Spectra_Stack
+from sPyktro_peaks import Stack_Peaks
+
+# A map on disk is a .npy file of the (rows, cols, L) intensity and a .wavenumber.npy file of the L raman shifts next to it.
+# The intensity is memory mapped, so a map larger than the memory is read a chunk of pixels at a time by the processing functions,
+# and every processed map is written to a new .npy file the same way.
+# A map written to a temporary file, when no path is given, deletes its files once it is closed or no longer referenced.
+
+
+def get_wavenumber_path(path):
+    return os.path.splitext(path)[0] + ".wavenumber.npy"
+
+
+def remove_map_files(path):
+    for file_path in (path, get_wavenumber_path(path)):
+        try:
+            os.remove(file_path)
+        except OSError: # already removed, or still mapped by a view on Windows
+            pass
+
+
+class Raman_Map:
+    # rows x cols raman spectra sharing one wavenumber axis, as a memory mapped (rows, cols, L) intensity array.
+    # The processing functions run the Spectra_Stack functions over chunks of chunk_size pixels and return a new Raman_Map,
+    # the same way the Spectra_Stack functions return a new Spectra_Stack.
+
+    def __init__(self, wavenumber, intensity, sample_name = "map", path = None, lineage = None, chunk_size = 4096):
+        '''
+        input
+            wavenumber: 1-D array of raman shift, shared by all pixels
+            intensity: (rows, cols, L) array of intensity, usually a np.memmap
+            sample_name: name of the map, the picked spectra are named after it
+            path: the .npy file of intensity, None if the map is only in memory
+            lineage: list of (name, parameters) of the processing steps from the original map to this one.
+                The map keeps the steps instead of its parent, so a temporary parent map is deleted once it is no longer used
+            chunk_size: number of pixels processed at once
+        '''
+        wavenumber = np.asarray(wavenumber)
+        if wavenumber.ndim != 1 or intensity.ndim != 3 or intensity.shape[2] != wavenumber.shape[0]:
+            raise Exception("intensity has to be a (rows, cols, L) array with L the length of wavenumber")
+
+        self.wavenumber = wavenumber
+        self.intensity = intensity
+        self.sample_name = sample_name
+        self.path = path
+
+        self.lineage = lineage if lineage is not None else [("map", {"path": path})]
+        self.chunk_size = chunk_size
+        self.finalizer = None # deletes the files of a temporary map
+
+    @classmethod
+    def open(cls, path, sample_name = None, mode = 'r'):
+        '''
+        input
+            path: .npy file of a (rows, cols, L) intensity, with its .wavenumber.npy file next to it
+            sample_name: name of the map. Default is the file name
+            mode: 'r' read only, 'r+' to modify the file in place
+        '''
+        wavenumber_path = get_wavenumber_path(path)
+        if not os.path.exists(wavenumber_path):
+            raise Exception("No raman shift file " + os.path.basename(wavenumber_path) + " for the map " + os.path.basename(path))
+
+        if sample_name is None:
+            sample_name = os.path.splitext(os.path.basename(path))[0]
+        intensity = np.load(path, mmap_mode = mode)
+        return cls(np.load(wavenumber_path), intensity, sample_name, path = path)
+
+    @classmethod
+    def create(cls, path, wavenumber, rows, cols, dtype = np.float32, sample_name = None, lineage = None):
+        # a new map file of zeros, filled by writing to its intensity, e.g. pixel by pixel during an acquisition.
+        # Without a path the map is a temporary file, deleted by close() or once the map is no longer referenced
+        temporary = path is None
+        if temporary:
+            temp_fd, path = tempfile.mkstemp(suffix = ".npy")
+            os.close(temp_fd)
+        if sample_name is None:
+            sample_name = os.path.splitext(os.path.basename(path))[0]
+
+        wavenumber = np.asarray(wavenumber)
+        np.save(get_wavenumber_path(path), wavenumber)
+        intensity = np.lib.format.open_memmap(path, mode = 'w+', dtype = dtype, shape = (rows, cols, wavenumber.shape[0]))
+        new_map = cls(wavenumber, intensity, sample_name, path = path, lineage = lineage)
+        if temporary:
+            new_map.finalizer = weakref.finalize(new_map, remove_map_files, path)
+        return new_map
+
+    @classmethod
+    def from_spectra(cls, spectra_list, rows, cols, path = None):
+        # a map of rows * cols Raman_Spectra with the same wavenumber, in row major order
+        if len(spectra_list) != rows * cols:
+            raise Exception("A " + str(rows) + " x " + str(cols) + " map needs " + str(rows * cols) + " spectra")
+
+        new_map = cls.create(path, spectra_list[0].wavenumber, rows, cols)
+        pixels = new_map.get_pixels()
+        for start in range(0, len(spectra_list), new_map.chunk_size):
+            stack = Spectra_Stack.from_spectra(spectra_list[start:start+new_map.chunk_size])
+            pixels[start:start+len(stack)] = stack.intensity
+        new_map.flush()
+        return new_map
+
+    def __len__(self):
+        return self.intensity.shape[0] * self.intensity.shape[1]
+
+    def __str__(self):
+        return "Raman_Map " + self.sample_name + " of " + str(self.intensity.shape[0]) + " x " + str(self.intensity.shape[1]) + " pixels"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_shape(self):
+        # (rows, cols)
+        return self.intensity.shape[0], self.intensity.shape[1]
+
+    def get_pixels(self):
+        # the intensity as a (rows * cols, L) array of pixels in row major order, a view of the file
+        return self.intensity.reshape(len(self), self.wavenumber.shape[0])
+
+    def get_lineage(self):
+        return list(self.lineage)
+
+    def close(self):
+        # release the memory map, the files of a temporary map are deleted. The map can not be used afterwards
+        self.intensity = None
+        if self.finalizer is not None:
+            self.finalizer()
+
+    def flush(self):
+        if isinstance(self.intensity, np.memmap):
+            self.intensity.flush()
+
+    def iter_chunks(self):
+        # (start, end, Spectra_Stack) of every chunk of pixels, pixel start to end in row major order.
+        # Each chunk is read from the file into memory once
+        pixels = self.get_pixels()
+        for start in range(0, len(self), self.chunk_size):
+            end = min(start + self.chunk_size, len(self))
+            yield start, end, Spectra_Stack(self.wavenumber, np.array(pixels[start:end]))
+
+    def get_spectra(self, row, col):
+        # the spectra of a pixel as a Raman_Spectra, copied from the file
+        return Raman_Spectra.from_arrays(self.wavenumber, np.array(self.intensity[row, col]),
+            self.sample_name + " (" + str(row) + ", " + str(col) + ")",
+            process = ("map_pixel", {"map": self.path, "row": row, "col": col}))
+
+    def get_region_mean(self, row_start, row_end, col_start, col_end):
+        # the mean spectra of the pixels in rows row_start to row_end and cols col_start to col_end, ends excluded
+        row_start, row_end = max(row_start, 0), min(row_end, self.intensity.shape[0])
+        col_start, col_end = max(col_start, 0), min(col_end, self.intensity.shape[1])
+        if row_start >= row_end or col_start >= col_end:
+            raise Exception("The region has no pixels")
+
+        rows_per_chunk = max(self.chunk_size // (col_end - col_start), 1)
+        total = np.zeros(self.wavenumber.shape[0])
+        for row in range(row_start, row_end, rows_per_chunk):
+            total += self.intensity[row:min(row + rows_per_chunk, row_end), col_start:col_end].sum(axis = (0, 1), dtype = np.float64)
+        mean = total / ((row_end - row_start) * (col_end - col_start))
+
+        return Raman_Spectra.from_arrays(self.wavenumber, mean,
+            self.sample_name + " mean (" + str(row_start) + ":" + str(row_end) + ", " + str(col_start) + ":" + str(col_end) + ")",
+            process = ("map_region_mean", {"map": self.path, "rows": [row_start, row_end], "cols": [col_start, col_end]}))
+
+    def apply(self, process_name, parameters, path = None, sample_name = None):
+        '''
+        Run a Spectra_Stack processing function over the map, a chunk of pixels at a time, and write the result to a new map file.
+
+        input
+            process_name: name of the Spectra_Stack function, e.g. "baseline_als"
+            parameters: dict of the keyword arguments of the function
+            path: .npy file of the new map. Default is a temporary file
+            sample_name: name of the new map. Default is process_name and the name of this map
+
+        output
+            a new Raman_Map, with the lineage of this map and the new step
+        '''
+        if len(self) == 0: # the new map is created from the first chunk, there is none
+            raise Exception("The map " + self.sample_name + " has no pixels")
+        if sample_name is None:
+            sample_name = process_name + " " + self.sample_name
+
+        rows, cols = self.get_shape()
+        new_map = None
+        for start, end, stack in self.iter_chunks():
+            new_stack = getattr(stack, process_name)(**parameters)
+            if new_map is None: # cut and interpolate change the raman shift, the new map is created from the first chunk
+                new_map = Raman_Map.create(path, new_stack.wavenumber, rows, cols,
+                    dtype = np.result_type(self.intensity.dtype, np.float32), sample_name = sample_name,
+                    lineage = self.lineage + [(process_name, parameters)])
+                new_map.chunk_size = self.chunk_size
+                new_pixels = new_map.get_pixels()
+            new_pixels[start:end] = new_stack.intensity
+
+        new_map.flush()
+        return new_map
+
+    def cut(self, start = 0, end = None, path = None):
+        return self.apply("cut", {"start": start, "end": end}, path = path)
+
+    def interpolate(self, start, end, num, path = None):
+        return self.apply("interpolate", {"start": start, "end": end, "num": num}, path = path)
+
+    def spectra_scaling(self, scale_factor, path = None):
+        return self.apply("spectra_scaling", {"scale_factor": scale_factor}, path = path)
+
+    def spectra_smoothing(self, filter_window, filter_degree, path = None):
+        return self.apply("spectra_smoothing", {"filter_window": filter_window, "filter_degree": filter_degree}, path = path)
+
+    def baseline_als(self, lam = 100, p = 0.01, niter = 10, path = None):
+        return self.apply("baseline_als", {"lam": lam, "p": p, "niter": niter}, path = path)
+
+    def baseline_modpoly(self, degree = 2, repitition = 100, gradient = 0.001, path = None):
+        return self.apply("baseline_modpoly", {"degree": degree, "repitition": repitition, "gradient": gradient}, path = path)
+
+    def baseline_arpls(self, lam = 1e5, ratio = 0.001, niter = 50, path = None):
+        return self.apply("baseline_arpls", {"lam": lam, "ratio": ratio, "niter": niter}, path = path)
+
+    def baseline_airpls(self, lam = 100, niter = 15, path = None):
+        return self.apply("baseline_airpls", {"lam": lam, "niter": niter}, path = path)
+
+    def baseline_snip(self, max_half_window = 40, lls = True, path = None):
+        return self.apply("baseline_snip", {"max_half_window": max_half_window, "lls": lls}, path = path)
+
+    def baseline_rolling_ball(self, half_window = 50, smooth_half_window = 0, path = None):
+        return self.apply("baseline_rolling_ball", {"half_window": half_window, "smooth_half_window": smooth_half_window}, path = path)
+
+    def band_integration(self, start, end, local_baseline = False, path = None):
+        '''
+        Integrated intensity of a band in every pixel, e.g. for the image of a peak over the map.
+
+        input
+            start, end: raman shift of the band edges
+            local_baseline: subtract the straight line between the intensity at the two band edges before integrating
+            path: .npy file of the image, None keeps the image in memory
+
+        output
+            (rows, cols) array, a np.memmap of path if path is given
+        '''
+        start_index = np.argmin(np.abs(self.wavenumber - start))
+        end_index = np.argmin(np.abs(self.wavenumber - end))
+        if start_index > end_index: # raman shift saved in decreasing order
+            start_index, end_index = end_index, start_index
+        x = self.wavenumber[start_index:end_index+1]
+        if x.shape[0] < 2:
+            raise Exception("The band from " + str(start) + " to " + str(end) + " has less than two points")
+
+        rows, cols = self.get_shape()
+        if path is None:
+            image = np.zeros((rows, cols))
+        else:
+            image = np.lib.format.open_memmap(path, mode = 'w+', dtype = np.float64, shape = (rows, cols))
+        flat_image = image.reshape(len(self))
+
+        pixels = self.get_pixels()
+        for start_pixel in range(0, len(self), self.chunk_size):
+            end_pixel = min(start_pixel + self.chunk_size, len(self))
+            y = np.asarray(pixels[start_pixel:end_pixel, start_index:end_index+1], dtype = np.float64)
+            area = trapezoid(y, x, axis = 1)
+            if local_baseline: # the area under the line is the mean of the edges times the band width
+                area = area - (y[:, 0] + y[:, -1]) / 2 * (x[-1] - x[0])
+            flat_image[start_pixel:end_pixel] = area
+
+        if path is not None:
+            image.flush()
+        return image
+
+    def find_raman_peaks(self, filter_window = None, filter_degree = None, lower_prominance = None, higher_prominance = None, lower_height = 0):
+        '''
+        Raman_Spectra.find_raman_peaks for every pixel, a chunk at a time.
+
+        output
+            a Stack_Peaks of all pixels, the row of a peak is its pixel number row * cols + col
+        '''
+        chunk_peaks = []
+        for start, end, stack in self.iter_chunks():
+            peaks = stack.find_raman_peaks(filter_window = filter_window, filter_degree = filter_degree,
+                lower_prominance = lower_prominance, higher_prominance = higher_prominance, lower_height = lower_height)
+            chunk_peaks.append((start, peaks))
+
+        return Stack_Peaks(np.concatenate([start + peaks.row for start, peaks in chunk_peaks]),
+            np.concatenate([peaks.index for _, peaks in chunk_peaks]),
+            np.concatenate([peaks.position for _, peaks in chunk_peaks]),
+            np.concatenate([peaks.height for _, peaks in chunk_peaks]),
+            np.concatenate([peaks.prominence for _, peaks in chunk_peaks]),
+            len(self))
@@ -1,7 +1,9 @@
 import sys, os
 from PySide6 import QtCore, QtGui, QtWidgets
 from PySide6.QtWidgets import *
-from PySide6.QtGui import QIcon, QPixmap
+from PySide6.QtGui import QIcon, QPixmap, QDoubleValidator
+import pyqtgraph as pg
+import numpy as np
 from sPyktro_raman import Raman_Spectra
 from sPyktro_window import Ui_MainWindow
 
@@ -232,4 +234,142 @@ class Line_window(QDialog):
         error_win.setWindowTitle("Error")
         error_win.setText(text)
         error_win.setInformativeText(informative_txt)
-        error_win.exec_()
\ No newline at end of file
+        error_win.exec_()
+
+class Map_window(QDialog):
+    # image of a band of a Raman_Map. Clicking a pixel plots its spectra, the rectangle plots the mean spectra of its pixels
+    spectra_picked = QtCore.Signal(object) # list of Raman_Spectra
+
+    def __init__(self, raman_map):
+        super().__init__()
+        self.raman_map = raman_map
+        self.setWindowTitle("Map " + raman_map.sample_name)
+
+        rows, cols = raman_map.get_shape()
+        self.image_widget = pg.GraphicsLayoutWidget()
+        self.image_view = self.image_widget.addViewBox(lockAspect = True, invertY = True)
+        self.image_item = pg.ImageItem(axisOrder = 'row-major')
+        self.image_view.addItem(self.image_item)
+        self.region_roi = pg.RectROI([0, 0], [max(cols // 4, 1), max(rows // 4, 1)], pen = 'r',
+            maxBounds = QtCore.QRectF(0, 0, cols, rows), snapSize = 1, scaleSnap = True, translateSnap = True)
+        self.image_view.addItem(self.region_roi)
+        self.image_item.mouseClickEvent = self.image_clicked
+
+        self.onlyFloat = QDoubleValidator()
+        self.lineEdit_band_start = QLineEdit(self)
+        self.lineEdit_band_end = QLineEdit(self)
+        self.lineEdit_band_start.setValidator(self.onlyFloat)
+        self.lineEdit_band_end.setValidator(self.onlyFloat)
+        self.lineEdit_band_start.setText(str(round(float(np.min(raman_map.wavenumber)), 2)))
+        self.lineEdit_band_end.setText(str(round(float(np.max(raman_map.wavenumber)), 2)))
+        self.pushUpdate = QPushButton("Update", self)
+        self.pushUpdate.clicked.connect(self.image_update)
+
+        band_layout = QHBoxLayout()
+        band_layout.addWidget(QLabel("Band Start:"))
+        band_layout.addWidget(self.lineEdit_band_start)
+        band_layout.addWidget(QLabel("End:"))
+        band_layout.addWidget(self.lineEdit_band_end)
+        band_layout.addWidget(self.pushUpdate)
+
+        self.pixel_label = QLabel(str(rows) + " x " + str(cols) + " pixels, click a pixel to plot its spectra")
+        self.pushRegion = QPushButton("Plot Region Mean", self)
+        self.pushRegion.clicked.connect(self.region_picked)
+        pick_layout = QHBoxLayout()
+        pick_layout.addWidget(self.pixel_label)
+        pick_layout.addStretch()
+        pick_layout.addWidget(self.pushRegion)
+
+        self.layout = QVBoxLayout()
+        self.layout.addLayout(band_layout)
+        self.layout.addWidget(self.image_widget)
+        self.layout.addLayout(pick_layout)
+        self.setLayout(self.layout)
+        self.resize(600, 600)
+
+        self.image_update()
+
+    def image_update(self):
+        try:
+            start = float(self.lineEdit_band_start.text())
+            end = float(self.lineEdit_band_end.text())
+        except ValueError:
+            self.show_error_win("Input Error", "Please input a number for Band Start and End")
+            return
+
+        QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            image = self.raman_map.band_integration(start, end)
+        except Exception as x:
+            QApplication.restoreOverrideCursor()
+            self.show_error_win("Input Error", str(x))
+            return
+        QApplication.restoreOverrideCursor()
+        self.image_item.setImage(image)
+
+    def image_clicked(self, event):
+        if event.button() != QtCore.Qt.LeftButton:
+            return
+        event.accept()
+        position = event.pos() # image coordinates, x is the col and y the row
+        row, col = int(position.y()), int(position.x())
+        rows, cols = self.raman_map.get_shape()
+        if 0 <= row < rows and 0 <= col < cols:
+            self.pixel_label.setText("Pixel (" + str(row) + ", " + str(col) + ")")
+            self.spectra_picked.emit([self.raman_map.get_spectra(row, col)])
+
+    def region_picked(self):
+        col_start, row_start = (int(round(v)) for v in self.region_roi.pos())
+        col_size, row_size = (int(round(v)) for v in self.region_roi.size())
+        try:
+            spectra = self.raman_map.get_region_mean(row_start, row_start + row_size, col_start, col_start + col_size)
+        except Exception as x:
+            self.show_error_win("Input Error", str(x))
+            return
+        self.spectra_picked.emit([spectra])
+
+    def show_error_win(self, text, informative_txt):
+        error_win = QMessageBox()
+        error_win.setWindowTitle("Error")
+        error_win.setText(text)
+        error_win.setInformativeText(informative_txt)
+        error_win.exec_()
+
+class Live_window(QDialog):
+    # waterfall of the spectra in the ring buffer of a live acquisition, oldest at the top. The newest spectra is drawn in the main plot
+    add_requested = QtCore.Signal()
+
+    def __init__(self, source_name):
+        super().__init__()
+        self.setWindowTitle("Live " + source_name)
+
+        self.waterfall_widget = pg.PlotWidget()
+        self.waterfall_widget.invertY(True)
+        self.waterfall_widget.setLabel('bottom', 'Raman Shift')
+        self.waterfall_widget.setLabel('left', 'Spectra')
+        self.image_item = pg.ImageItem(axisOrder = 'row-major')
+        self.waterfall_widget.addItem(self.image_item)
+
+        self.status_label = QLabel("Waiting for spectra from " + source_name)
+        self.pushAdd = QPushButton("Add Latest to List", self)
+        self.pushAdd.clicked.connect(self.add_requested)
+        self.pushStop = QPushButton("Stop", self)
+        self.pushStop.clicked.connect(self.accept)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.status_label)
+        button_layout.addStretch()
+        button_layout.addWidget(self.pushAdd)
+        button_layout.addWidget(self.pushStop)
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.waterfall_widget)
+        self.layout.addLayout(button_layout)
+        self.setLayout(self.layout)
+        self.resize(700, 500)
+
+    def waterfall_update(self, wavenumber, waterfall, count, latest_name):
+        # the image is replaced in place, its size is fixed by the ring buffer capacity
+        self.image_item.setImage(waterfall, autoLevels = True)
+        x_min, x_max = float(np.min(wavenumber)), float(np.max(wavenumber))
+        self.image_item.setRect(QtCore.QRectF(x_min, count - waterfall.shape[0], x_max - x_min, waterfall.shape[0]))
+        self.status_label.setText(str(count) + " spectra received, latest " + latest_name)
@@ -0,0 +1,172 @@
+import numpy as np
+from scipy.signal import find_peaks, savgol_filter
+
+
+def find_stack_peaks(wavenumber, intensity, filter_window = None, filter_degree = None, lower_prominance = None, higher_prominance = None, lower_height = 0):
+    '''
+    find_raman_peaks over a (N, L) batch of spectra. The smoothing runs along axis 1 in one call, scipy find_peaks runs row by row.
+
+    input
+        wavenumber: 1-D array of raman shift shared by all rows
+        intensity: (N, L) array of intensity
+        filter_window, filter_degree, lower_prominance, higher_prominance, lower_height: see Raman_Spectra.find_raman_peaks
+
+    output
+        a Stack_Peaks
+    '''
+    intensity = np.atleast_2d(intensity)
+    if filter_window is not None and filter_degree is not None:
+        intensity = savgol_filter(intensity, filter_window, filter_degree, axis = 1)
+
+    index_list = []
+    prominence_list = []
+    counts = np.zeros(intensity.shape[0], dtype = np.intp)
+    for i, row in enumerate(intensity):
+        peaks_index, properties = find_peaks(row, prominence = (lower_prominance, higher_prominance), height = lower_height)
+        index_list.append(peaks_index)
+        prominence_list.append(properties["prominences"])
+        counts[i] = peaks_index.shape[0]
+
+    row = np.repeat(np.arange(intensity.shape[0]), counts)
+    index = np.concatenate(index_list) if index_list else np.zeros(0, dtype = np.intp)
+    prominence = np.concatenate(prominence_list) if prominence_list else np.zeros(0)
+    return Stack_Peaks(row, index, wavenumber[index], intensity[row, index], prominence, intensity.shape[0])
+
+
+class Stack_Peaks:
+    # the peaks of every spectra of a stack as flat arrays, one entry per peak, sorted by row and then by index.
+    # The peaks of row i are peaks[offsets[i]:offsets[i+1]].
+
+    def __init__(self, row, index, position, height, prominence, spectra_num):
+        self.row = row # (P,) row of the spectra in the stack
+        self.index = index # (P,) index of the peak in the spectra
+        self.position = position # (P,) raman shift of the peak
+        self.height = height # (P,) intensity at the peak, after smoothing
+        self.prominence = prominence # (P,)
+        self.spectra_num = spectra_num
+        self.offsets = np.searchsorted(row, np.arange(spectra_num + 1))
+
+    def __len__(self):
+        return self.row.shape[0]
+
+    def __str__(self):
+        return "Stack_Peaks of " + str(len(self)) + " peaks in " + str(self.spectra_num) + " spectra"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_row(self, i):
+        # (index, position, height) of the peaks of spectra i
+        peaks = slice(self.offsets[i], self.offsets[i+1])
+        return self.index[peaks], self.position[peaks], self.height[peaks]
+
+    def nearest_in_row(self, row_shift, max_shift):
+        '''
+        For every peak, the nearest peak in row + row_shift, without a python loop over the rows.
+        Every peak gets the key row * span + index, so the keys of all peaks are sorted and one searchsorted finds the two neighbours
+        of each query in the target row. The raman shift is monotonic in the index, so the nearest peak is one of those two.
+
+        output
+            (P,) index of the nearest peak, -1 if there is none within max_shift
+        '''
+        P = len(self)
+        nearest = np.full(P, -1, dtype = np.intp)
+        if P == 0:
+            return nearest
+
+        span = int(self.index.max()) + 1
+        keys = self.row * span + self.index
+
+        target_row = self.row + row_shift
+        right = np.searchsorted(keys, target_row * span + self.index)
+        left = np.maximum(right - 1, 0)
+        right = np.minimum(right, P - 1)
+
+        distance_left = np.where(self.row[left] == target_row, np.abs(self.position[left] - self.position), np.inf)
+        distance_right = np.where(self.row[right] == target_row, np.abs(self.position[right] - self.position), np.inf)
+        use_right = distance_right < distance_left
+        candidate = np.where(use_right, right, left)
+        distance = np.where(use_right, distance_right, distance_left)
+
+        within = distance <= max_shift
+        nearest[within] = candidate[within]
+        return nearest
+
+    def track_peaks(self, max_shift):
+        '''
+        Link the peaks of consecutive spectra into tracks. A peak in row i and a peak in row i+1 are linked when each is the nearest peak
+        of the other within max_shift (mutual nearest neighbours), so every peak has at most one predecessor and one successor.
+        Runs in O(P log P) for P peaks in total.
+
+        input
+            max_shift: largest change of raman shift of a peak between two consecutive spectra
+
+        output
+            a Peak_Tracks
+        '''
+        forward = self.nearest_in_row(1, max_shift)
+        backward = self.nearest_in_row(-1, max_shift)
+
+        previous = np.full(len(self), -1, dtype = np.intp)
+        linked = np.flatnonzero(forward >= 0)
+        linked = linked[backward[forward[linked]] == linked]
+        previous[forward[linked]] = linked
+
+        # pointer jumping: every peak follows its predecessors to the first peak of the track in log2(N) passes
+        first = np.where(previous >= 0, previous, np.arange(len(self)))
+        while True:
+            next_first = first[first]
+            if np.array_equal(next_first, first):
+                break
+            first = next_first
+
+        _, track_id = np.unique(first, return_inverse = True)
+        return Peak_Tracks(self, track_id.reshape(-1))
+
+
+class Peak_Tracks:
+    # peaks of a Stack_Peaks grouped into tracks, track_id[p] is the track of peak p. Tracks are numbered by their first peak.
+
+    def __init__(self, peaks, track_id):
+        self.peaks = peaks
+        self.track_id = track_id
+
+    def __len__(self):
+        return int(self.track_id.max()) + 1 if self.track_id.size else 0
+
+    def __str__(self):
+        return "Peak_Tracks of " + str(len(self)) + " tracks over " + str(self.peaks.spectra_num) + " spectra"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_track_lengths(self):
+        return np.bincount(self.track_id, minlength = len(self))
+
+    def get_track(self, t):
+        # (row, position, height) of the peaks of track t in row order
+        members = np.flatnonzero(self.track_id == t)
+        return self.peaks.row[members], self.peaks.position[members], self.peaks.height[members]
+
+    def to_arrays(self, min_length = 1):
+        '''
+        Position and height over the spectra series of every track with at least min_length peaks.
+
+        output
+            track_index: (T,) track numbers
+            position: (T, N) raman shift of each track in each spectra, nan where the track has no peak
+            height: (T, N) peak intensity, nan where the track has no peak
+        '''
+        track_index = np.flatnonzero(self.get_track_lengths() >= min_length)
+        track_row = np.full(len(self), -1, dtype = np.intp)
+        track_row[track_index] = np.arange(track_index.shape[0])
+
+        kept = track_row[self.track_id] >= 0
+        rows = track_row[self.track_id[kept]]
+        columns = self.peaks.row[kept]
+
+        position = np.full((track_index.shape[0], self.peaks.spectra_num), np.nan)
+        height = np.full((track_index.shape[0], self.peaks.spectra_num), np.nan)
+        position[rows, columns] = self.peaks.position[kept]
+        height[rows, columns] = self.peaks.height[kept]
+        return track_index, position, height
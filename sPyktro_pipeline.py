@@ -0,0 +1,293 @@
+import json
+from functools import lru_cache
+import numpy as np
+from scipy.signal import savgol_coeffs
+from scipy.ndimage import correlate1d
+from scipy.integrate import trapezoid
+from sPyktro_raman import Raman_Spectra
+import sPyktro_baseline
+
+# A Spectra_Pipeline records processing steps as (name, parameters) and runs them only when it is applied to spectra.
+# The whole chain runs over a (N, L) batch in one pass: cuts are views, the other steps write into two buffers kept by the pipeline
+# and reused from step to step and from batch to batch, so a chain of steps allocates no intermediate spectra.
+# A pipeline is saved as the json list of its steps, the same form as get_lineage() and the recipes of sPyktro_cli.py.
+
+baseline_functions = {
+    "baseline_als": sPyktro_baseline.als,
+    "baseline_modpoly": sPyktro_baseline.modpoly,
+    "baseline_arpls": sPyktro_baseline.arpls,
+    "baseline_airpls": sPyktro_baseline.airpls,
+    "baseline_snip": sPyktro_baseline.snip,
+    "baseline_rolling_ball": sPyktro_baseline.rolling_ball,
+}
+
+pipeline_steps = ("cut", "interpolate", "spectra_scaling", "spectra_smoothing", "spectra_normalization") + tuple(baseline_functions)
+
+# steps of a lineage that are not processing, the pipeline starts after them
+source_steps = ("load", "map_pixel", "map_region_mean")
+
+
+@lru_cache(maxsize = 32)
+def savgol_operators(filter_window, filter_degree):
+    '''
+    Savitzky-Golay smoothing as linear operators, the same result as savgol_filter(mode = 'interp') of scipy.
+    The inner points are a correlation with coefficients. The first and last filter_window // 2 points are the polynomial fitted
+    to the first and last filter_window points, which is a (half, filter_window) matrix applied to those points.
+    '''
+    coefficients = savgol_coeffs(filter_window, filter_degree, use = 'dot')
+    half = filter_window // 2
+    vander = np.vander(np.arange(filter_window, dtype = float), filter_degree + 1)
+    fit = np.linalg.pinv(vander)
+    left = vander[:half] @ fit
+    right = vander[filter_window-half:] @ fit
+    for array in (coefficients, left, right):
+        array.flags.writeable = False
+    return coefficients, left, right
+
+
+class Spectra_Pipeline:
+
+    def __init__(self, steps = None):
+        '''
+        input
+            steps: list of (name, parameters), e.g. [("cut", {"start": 200, "end": 1800}), ("baseline_als", {"lam": 1e5})]
+        '''
+        self.steps = []
+        self.buffers = {} # shape -> list of reused (N, L) arrays
+        for name, parameters in steps or []:
+            self.add_step(name, parameters)
+
+    def add_step(self, name, parameters = None):
+        if name not in pipeline_steps:
+            raise Exception("Unknown pipeline step " + str(name) + ", the steps are " + ", ".join(pipeline_steps))
+        self.steps.append((name, dict(parameters or {})))
+        return self
+
+    # the steps are added with the same arguments as the Raman_Spectra functions, e.g. Spectra_Pipeline().cut(200, 1800).baseline_als(lam = 1e5)
+
+    def cut(self, start = 0, end = None):
+        return self.add_step("cut", {"start": start, "end": end})
+
+    def interpolate(self, start, end, num):
+        return self.add_step("interpolate", {"start": start, "end": end, "num": num})
+
+    def spectra_scaling(self, scale_factor):
+        return self.add_step("spectra_scaling", {"scale_factor": scale_factor})
+
+    def spectra_smoothing(self, filter_window, filter_degree):
+        return self.add_step("spectra_smoothing", {"filter_window": filter_window, "filter_degree": filter_degree})
+
+    def spectra_normalization(self, method = "max"):
+        return self.add_step("spectra_normalization", {"method": method})
+
+    def baseline_als(self, lam = 100, p = 0.01, niter = 10):
+        return self.add_step("baseline_als", {"lam": lam, "p": p, "niter": niter})
+
+    def baseline_modpoly(self, degree = 2, repitition = 100, gradient = 0.001):
+        return self.add_step("baseline_modpoly", {"degree": degree, "repitition": repitition, "gradient": gradient})
+
+    def baseline_arpls(self, lam = 1e5, ratio = 0.001, niter = 50):
+        return self.add_step("baseline_arpls", {"lam": lam, "ratio": ratio, "niter": niter})
+
+    def baseline_airpls(self, lam = 100, niter = 15):
+        return self.add_step("baseline_airpls", {"lam": lam, "niter": niter})
+
+    def baseline_snip(self, max_half_window = 40, lls = True):
+        return self.add_step("baseline_snip", {"max_half_window": max_half_window, "lls": lls})
+
+    def baseline_rolling_ball(self, half_window = 50, smooth_half_window = 0):
+        return self.add_step("baseline_rolling_ball", {"half_window": half_window, "smooth_half_window": smooth_half_window})
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __eq__(self, other):
+        return isinstance(other, Spectra_Pipeline) and self.to_list() == other.to_list()
+
+    def __str__(self):
+        return "Spectra_Pipeline of " + str(len(self)) + " steps: " + ", ".join(name for name, _ in self.steps)
+
+    def __repr__(self):
+        return self.__str__()
+
+    # the buffers are not pickled, a pipeline sent to a worker process starts with none
+
+    def __getstate__(self):
+        return {"steps": self.steps}
+
+    def __setstate__(self, state):
+        self.steps = state["steps"]
+        self.buffers = {}
+
+    def to_list(self):
+        # [[name, parameters], ...] with the parameters as json types
+        return json.loads(self.to_json())
+
+    def to_json(self):
+        return json.dumps([[name, parameters] for name, parameters in self.steps],
+            default = lambda value: value.tolist() if isinstance(value, (np.ndarray, np.generic)) else str(value))
+
+    @classmethod
+    def from_json(cls, text):
+        steps = json.loads(text)
+        for step in steps:
+            if not isinstance(step, list) or len(step) != 2 or not isinstance(step[1], dict):
+                raise Exception("A pipeline step has to be [name, parameters], " + json.dumps(step) + " is not")
+        return cls(steps)
+
+    def save(self, path):
+        with open(path, "w") as pipeline_file:
+            pipeline_file.write(self.to_json())
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as pipeline_file:
+            return cls.from_json(pipeline_file.read())
+
+    @classmethod
+    def from_lineage(cls, lineage):
+        # the processing steps of a lineage from Raman_Spectra.get_lineage, the steps reading the spectra are left out
+        return cls([(name, parameters) for name, parameters in lineage if name not in source_steps])
+
+    def get_buffer(self, shape, current):
+        # a buffer of shape not sharing memory with the current intensity
+        buffers = self.buffers.setdefault(shape, [])
+        for buffer in buffers:
+            if not np.shares_memory(buffer, current):
+                return buffer
+        buffer = np.empty(shape)
+        buffers.append(buffer)
+        return buffer
+
+    def run_stack(self, wavenumber, intensity, out = None):
+        '''
+        Run the steps over a batch of spectra sharing one wavenumber.
+
+        input
+            wavenumber: 1-D array of raman shift
+            intensity: (N, L) array of intensity, not modified
+            out: array for the result, allocated if None. The intermediate steps use the buffers of the pipeline
+
+        output
+            (wavenumber, intensity) of the result. intensity is out, or a view of the input if all steps are cuts
+        '''
+        x = np.asarray(wavenumber)
+        y = np.asarray(intensity, dtype = np.float64)
+        if y.ndim == 1:
+            y = y[np.newaxis, :]
+        owned = y is not intensity and not np.shares_memory(y, intensity) # a float64 copy of the input can be written in place
+
+        for name, parameters in self.steps:
+            if name in baseline_functions:
+                x, y, owned = self.step_baseline(baseline_functions[name], x, y, owned, parameters)
+            else:
+                x, y, owned = getattr(self, "step_" + name)(x, y, owned, **parameters)
+
+        if owned:
+            if out is None:
+                out = np.empty(y.shape)
+            np.copyto(out, y)
+            y = out
+        return x, y
+
+    def run_spectra(self, spectra_list):
+        '''
+        Run the steps over a list of Raman_Spectra. Spectra with the same wavenumber are stacked and run as one batch.
+
+        output
+            list of new Raman_Spectra in the order of spectra_list, each with its input as parent and the pipeline steps as its process
+        '''
+        groups = {} # (length, first, last) -> [(wavenumber, [index, ...])]
+        for i, spectra in enumerate(spectra_list):
+            wavenumber = spectra.wavenumber
+            key = (wavenumber.shape[0], float(wavenumber[0]), float(wavenumber[-1])) if wavenumber.shape[0] else (0, 0.0, 0.0)
+            for group_wavenumber, indices in groups.setdefault(key, []):
+                if group_wavenumber is wavenumber or np.array_equal(group_wavenumber, wavenumber):
+                    indices.append(i)
+                    break
+            else:
+                groups[key].append((wavenumber, [i]))
+
+        process = ("pipeline", {"steps": [(name, dict(parameters)) for name, parameters in self.steps]})
+        new_spectra_list = [None] * len(spectra_list)
+        for group_list in groups.values():
+            for wavenumber, indices in group_list:
+                intensity = np.empty((len(indices), wavenumber.shape[0]))
+                for row, i in enumerate(indices):
+                    intensity[row] = spectra_list[i].intensity
+                new_wavenumber, new_intensity = self.run_stack(wavenumber, intensity)
+                for row, i in enumerate(indices):
+                    new_spectra_list[i] = Raman_Spectra.from_arrays(new_wavenumber, new_intensity[row], spectra_list[i].sample_name + " processed",
+                        parent = spectra_list[i], process = process)
+        return new_spectra_list
+
+    def run(self, spectra):
+        # run the steps over a Raman_Spectra, a list of them or a Spectra_Stack
+        if isinstance(spectra, Raman_Spectra):
+            return self.run_spectra([spectra])[0]
+        if isinstance(spectra, (list, tuple)):
+            return self.run_spectra(spectra)
+
+        new_wavenumber, new_intensity = self.run_stack(spectra.wavenumber, spectra.intensity)
+        return spectra.new_stack(new_wavenumber, new_intensity, [name + " processed" for name in spectra.sample_names],
+            ("pipeline", {"steps": [(name, dict(parameters)) for name, parameters in self.steps]}))
+
+    # each step takes the raman shift x, the (N, L) intensity y and whether y may be written in place,
+    # and returns them for the next step. The results are the same as the Raman_Spectra functions
+
+    def step_cut(self, x, y, owned, start = 0, end = None):
+        start_index = np.argmin(np.abs(x - start))
+        end_index = np.argmin(np.abs(x - end)) if end else None
+        return x[start_index:end_index], y[:, start_index:end_index], owned
+
+    def step_interpolate(self, x, y, owned, start, end, num):
+        new_x = np.linspace(start, end, num)
+        if x[0] > x[-1]: # raman shift saved in decreasing order
+            x = x[::-1]
+            y = y[:, ::-1]
+
+        right_index = np.clip(np.searchsorted(x, new_x, side = 'right'), 1, x.shape[0] - 1)
+        left_index = right_index - 1
+        weight = np.clip((new_x - x[left_index]) / (x[right_index] - x[left_index]), 0, 1)
+
+        out = self.get_buffer((y.shape[0], num), y)
+        np.multiply(y[:, left_index], 1 - weight, out = out)
+        out += y[:, right_index] * weight
+        return new_x, out, True
+
+    def step_spectra_scaling(self, x, y, owned, scale_factor):
+        out = y if owned else self.get_buffer(y.shape, y)
+        np.multiply(y, scale_factor, out = out)
+        return x, out, True
+
+    def step_spectra_smoothing(self, x, y, owned, filter_window, filter_degree):
+        coefficients, left, right = savgol_operators(filter_window, filter_degree)
+        if y.shape[1] < filter_window:
+            raise Exception("spectra_smoothing needs spectra of at least filter_window points")
+
+        out = self.get_buffer(y.shape, y) # correlate1d can not write in place
+        correlate1d(y, coefficients, axis = 1, output = out, mode = 'constant')
+        half = filter_window // 2
+        np.matmul(y[:, :filter_window], left.T, out = out[:, :half])
+        np.matmul(y[:, -filter_window:], right.T, out = out[:, y.shape[1]-half:])
+        return x, out, True
+
+    def step_spectra_normalization(self, x, y, owned, method = "max"):
+        if method == "max":
+            norm = np.max(np.abs(y), axis = 1)
+        elif method == "area":
+            norm = np.abs(trapezoid(y, x, axis = 1))
+        elif method == "vector":
+            norm = np.linalg.norm(y, axis = 1)
+        else:
+            raise Exception("method has to be max, area or vector")
+
+        out = y if owned else self.get_buffer(y.shape, y)
+        np.divide(y, norm[:, np.newaxis], out = out)
+        return x, out, True
+
+    def step_baseline(self, baseline_function, x, y, owned, parameters):
+        z = baseline_function(y, **parameters)
+        out = y if owned else self.get_buffer(y.shape, y)
+        np.subtract(y, z, out = out)
+        return x, out, True
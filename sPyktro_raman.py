@@ -1,27 +1,41 @@
 import os
+import time
 import numpy as np
 from inspect import signature
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
-from scipy.signal import find_peaks
+from scipy.signal import find_peaks, peak_widths
 from scipy.signal import savgol_filter
-from scipy import sparse
-from scipy.sparse.linalg import spsolve
 from scipy.sparse import csc_matrix, eye, diags
 from scipy.optimize import curve_fit
+from scipy.special import wofz, erfcx
+from scipy.integrate import trapezoid
+from sPyktro_cache import Spectra_File_Cache
+import sPyktro_baseline
 
 
 project_directory = "/Users/bochen/TAMU/glass_transition_temp/Glassy SOA Raman Spectra/Spectra text files/"
 
+def read_only(array):
+    # the arrays of a spectra are shared by its copies, derived spectra and the undo history, so they are never written in place.
+    # A writable array is stored as a read only view, the caller keeps its own array writable
+    if array.flags.writeable:
+        array = array.view()
+        array.flags.writeable = False
+    return array
+
 class Raman_Spectra:
 
-    def __init__(self, file_path, sample_name, start = 0, end = None):
+    file_cache = Spectra_File_Cache() # binary cache of parsed text files. Set to None to always parse the text file
+
+    def __init__(self, file_path, sample_name, start = 0, end = None, spectra_data = None):
 
         # Read a raman spectra in a text file and initialize the .
         # The text file just have two columns dseparated by white space. One column is the wavenumber and the other is the intensity.
+        # spectra_data can be given when the file has already been parsed, e.g. by a loader running in another process.
 
         self.file_path = file_path
-        self.spectra_data = self.load_file(self.file_path)
+        if spectra_data is None:
+            spectra_data = self.load_file(self.file_path)
+        self.spectra_data = spectra_data
         self.start = start
         self.end = end
 
@@ -42,6 +56,65 @@ class Raman_Spectra:
         self.raman_peaks = None # initialize raman peaks as None. find_raman_peaks will give it a value
         self.baseline = None # initialize baseline as None. baseline correction functions will give it a value once called
         self.baseline_method = None
+
+        self.parent = None # the spectra this one is derived from. None for a spectra read from a file
+        self.process = None # (name, parameters) of the processing step that derived this spectra from its parent
+        self.saved_lineage = None # lineage recorded when the spectra was saved in a session file, see get_lineage
+
+        self.extents = None
+        self.get_extents()
+
+    @classmethod
+    def from_arrays(cls, wavenumber, intensity, sample_name, parent = None, process = None):
+        '''
+        Initialize a raman spectra from in memory arrays instead of a text file.
+        The arrays are referenced, not copied, so a derived spectra shares memory with its parent wherever it can. They are stored read only.
+
+        input
+            wavenumber: 1-D array of raman shift
+            intensity: 1-D array of intensity, same length as wavenumber
+            sample_name: name of the spectra
+            parent: the spectra this one is derived from, if any
+            process: (name, parameters) of the processing step that derived this spectra from parent
+        '''
+        wavenumber = read_only(np.asarray(wavenumber))
+        intensity = read_only(np.asarray(intensity))
+        if wavenumber.ndim != 1 or wavenumber.shape != intensity.shape:
+            raise Exception("wavenumber and intensity have to be 1-D arrays of the same length")
+
+        return_spectra = cls.__new__(cls)
+        return_spectra.file_path = None
+        return_spectra._spectra_data = None
+        return_spectra.start = 0
+        return_spectra.end = None
+
+        return_spectra.wavenumber = wavenumber
+        return_spectra.intensity = intensity
+        return_spectra.sample_name = sample_name
+
+        return_spectra.raman_peaks = None
+        return_spectra.baseline = None
+        return_spectra.baseline_method = None
+
+        return_spectra.parent = parent
+        return_spectra.process = process
+        return_spectra.saved_lineage = None
+
+        return_spectra.extents = None # computed on the first get_extents()
+
+        return return_spectra
+
+    @property
+    def spectra_data(self):
+        # the full two column data read from the file. Spectra built from arrays only stack their data on request.
+        if self._spectra_data is None:
+            self._spectra_data = read_only(np.stack((self.wavenumber, self.intensity), axis = 1))
+        return self._spectra_data
+
+    @spectra_data.setter
+    def spectra_data(self, spectra_data):
+        # wavenumber and intensity of a spectra read from a file are views of spectra_data, read only as well
+        self._spectra_data = None if spectra_data is None else read_only(spectra_data)
     
     def __str__(self):
         return self.sample_name
@@ -50,13 +123,45 @@ class Raman_Spectra:
         return self.__str__()
 
     def copy(self):
-        return Raman_Spectra(self.file_path, self.sample_name, start=self.start, end=self.end)
+        # the arrays are read only, so the copy shares them instead of reading the file again
+        return_spectra = self.from_arrays(self.wavenumber, self.intensity, self.sample_name, parent = self.parent, process = self.process)
+        return_spectra.file_path = self.file_path
+        return_spectra._spectra_data = self._spectra_data
+        return_spectra.start = self.start
+        return_spectra.end = self.end
+        return_spectra.saved_lineage = self.saved_lineage
+        return_spectra.extents = self.extents
+        return return_spectra
+
+    def get_extents(self):
+        # (min wavenumber, max wavenumber, min intensity, max intensity), computed once as the arrays are never modified in place
+        if self.extents is None:
+            self.extents = (float(np.amin(self.wavenumber)), float(np.amax(self.wavenumber)), float(np.amin(self.intensity)), float(np.amax(self.intensity)))
+        return self.extents
+
+    def get_lineage(self):
+        # list of the processing steps from the original file to this spectra, as (name, parameters)
+        lineage = []
+        spectra = self
+        while spectra is not None:
+            if spectra.saved_lineage is not None: # a spectra opened from a session file has no parents, only their recorded steps
+                lineage.extend(spectra.saved_lineage[::-1])
+                break
+            if spectra.process is not None and spectra.process[0] == "pipeline": # the steps of a Spectra_Pipeline run in one pass
+                lineage.extend(spectra.process[1]["steps"][::-1])
+            elif spectra.process is not None:
+                lineage.append(spectra.process)
+            elif spectra.file_path is not None:
+                lineage.append(("load", {"file_path": str(spectra.file_path), "start": spectra.start, "end": spectra.end}))
+            spectra = spectra.parent
+        return lineage[::-1]
 
     def cut(self, start = 0, end = None):
-        start_index = np.argmin(np.abs(self.spectra_data[:,0] - start))
+        start_index = np.argmin(np.abs(self.wavenumber - start))
         if end:
             end_index = np.argmin(np.abs(self.wavenumber - end))
 
+        # slices of the parent arrays are views, nothing is copied
         if not end:
             new_wavenumber = self.wavenumber[start_index:]
             new_intensity = self.intensity[start_index:]
@@ -64,18 +169,41 @@ class Raman_Spectra:
             new_wavenumber = self.wavenumber[start_index:end_index]
             new_intensity = self.intensity[start_index:end_index]
         
-        return_spectra = Raman_Spectra(np.stack((new_wavenumber, new_intensity), axis = 1), self.sample_name)
+        return_spectra = Raman_Spectra.from_arrays(new_wavenumber, new_intensity, self.sample_name, parent = self, process = ("cut", {"start": start, "end": end}))
 
         return return_spectra
 
-    def load_file(self, file_path):
+    @classmethod
+    def load_file(cls, file_path):
+        # a file parsed before is read from the binary cache instead of parsing the text again. The array is read only
+        if cls.file_cache is not None:
+            spectra_data = cls.file_cache.load(file_path)
+            if spectra_data is not None:
+                return spectra_data
+
         spectra_data = np.loadtxt(file_path, encoding='cp1252')
+
+        if cls.file_cache is not None:
+            cls.file_cache.save(file_path, spectra_data)
+        # read only like an array read from the cache, so the first load and the later ones behave the same
+        spectra_data.flags.writeable = False
         return spectra_data
     
     def get_spectra(self):
+        # copies of the arrays, for a caller that modifies them. Use get_spectra_view to only read them
         return np.copy(self.wavenumber), np.copy(self.intensity)
 
-    def quick_plot(self, show_peak = False, show_baseline = False, show_zeroline = False, output_dir = os.getcwd(), figure_size = (12, 8), y_lim_top = 0, spectra_color = 'k'):
+    def get_spectra_view(self):
+        # read only views of wavenumber and intensity, nothing is copied. Writing to them raises a ValueError
+        wavenumber = self.wavenumber.view()
+        intensity = self.intensity.view()
+        wavenumber.flags.writeable = False
+        intensity.flags.writeable = False
+        return wavenumber, intensity
+
+    def quick_plot(self, show_peak = False, show_baseline = False, show_zeroline = False, output_dir = os.getcwd(), figure_size = (12, 8), y_lim_top = 0, spectra_color = 'k', show_figure = True, save_figure = True):
+        # show_figure and save_figure can be turned off for batch jobs that only need the returned figure
+        import matplotlib.pyplot as plt
 
         fig, axs = plt.subplots(1, 1, figsize=figure_size)
         axs.plot(self.wavenumber, self.intensity, color = spectra_color, linewidth = 1)
@@ -99,8 +227,10 @@ class Raman_Spectra:
         
         axs.set_xlabel("Raman shift 1/cm")
         axs.set_ylabel("Intensity")
-        plt.show()
-        fig.savefig(self.sample_name + " Raman Spectra quick plot", dpi = 300)
+        if show_figure:
+            plt.show()
+        if save_figure:
+            fig.savefig(os.path.join(output_dir, self.sample_name + " Raman Spectra quick plot"), dpi = 300)
 
         return fig, axs
 
@@ -115,23 +245,12 @@ class Raman_Spectra:
             repitition: How many iterations to run. Default is 100
             gradient: Gradient for polynomial loss, default is 0.001. It measures incremental gain over each iteration. If gain in any iteration is less than this, further improvement will stop
         '''
-        criteria=np.inf
-        y = np.copy(self.intensity)
-        x = np.arange(y.shape[0])
-
-        nrep = 0
-        y_old = y
-        while (criteria>=gradient) and (nrep<=repitition):
-            p = np.polyfit(x, y_old, degree)
-            y_fit = np.polyval(p, x)
-            y_work = np.array(np.minimum(y_fit,y))
-            criteria = sum(np.abs((y_work-y)/y))
-
-            y_old = y_work
-            nrep = nrep + 1
+        # all spectra of the same length share one precomputed polynomial projector, see sPyktro_baseline.modpoly
+        y_work = sPyktro_baseline.modpoly(self.intensity, degree = degree, repitition = repitition, gradient = gradient)
         
-        return_spectra = Raman_Spectra(np.stack((self.wavenumber, self.intensity-y_fit), axis = 1), "modpoly baseline corrected "+self.sample_name)
-        self.baseline = y_fit
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, self.intensity-y_work, "modpoly baseline corrected "+self.sample_name, 
+            parent = self, process = ("baseline_modpoly", {"degree": degree, "repitition": repitition, "gradient": gradient}))
+        self.baseline = y_work
         self.baseline_method = 'Modified polyfit'
 
         return return_spectra
@@ -141,22 +260,67 @@ class Raman_Spectra:
     def baseline_als(self, lam = 100, p = 0.01, niter=10):
         # lam is for smoothness and p is for assymmetry
         # return a new spectra
+        # the penalty band is cached per (length, lam) and solved with a banded Cholesky solver, see sPyktro_baseline.als
 
-        y = np.copy(self.intensity)
-        L = len(y)
-        D = sparse.diags([1,-2,1],[0,-1,-2], shape=(L,L-2))
-        w = np.ones(L)
-        for i in range(niter):
-            W = sparse.spdiags(w, 0, L, L)
-            Z = W + lam * D.dot(D.transpose())
-            z = spsolve(Z, w*y)
-            w = p * (y > z) + (1-p) * (y < z)
+        z = sPyktro_baseline.als(self.intensity, lam = lam, p = p, niter = niter)
         
-        return_spectra = Raman_Spectra(np.stack((self.wavenumber, self.intensity-z), axis = 1), "als baseline corrected "+self.sample_name)
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, self.intensity-z, "als baseline corrected "+self.sample_name, 
+            parent = self, process = ("baseline_als", {"lam": lam, "p": p, "niter": niter}))
         self.baseline = z
         self.baseline_method = 'Asymmetric least square'
         return return_spectra
 
+    # Baseline correction using asymmetrically reweighted penalized least squares smoothing, by S.-J. Baek et al. (2015)
+    def baseline_arpls(self, lam = 1e5, ratio = 0.001, niter = 50):
+        # lam is for smoothness, iterations stop once the weights change less than ratio
+        # return a new spectra
+
+        z = sPyktro_baseline.arpls(self.intensity, lam = lam, ratio = ratio, niter = niter)
+
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, self.intensity-z, "arpls baseline corrected "+self.sample_name, 
+            parent = self, process = ("baseline_arpls", {"lam": lam, "ratio": ratio, "niter": niter}))
+        self.baseline = z
+        self.baseline_method = 'Asymmetrically reweighted penalized least square'
+        return return_spectra
+
+    # Baseline correction using adaptive iteratively reweighted penalized least squares, by Z.-M. Zhang et al. (2010)
+    def baseline_airpls(self, lam = 100, niter = 15):
+        # lam is for smoothness
+        # return a new spectra
+
+        z = sPyktro_baseline.airpls(self.intensity, lam = lam, niter = niter)
+
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, self.intensity-z, "airpls baseline corrected "+self.sample_name, 
+            parent = self, process = ("baseline_airpls", {"lam": lam, "niter": niter}))
+        self.baseline = z
+        self.baseline_method = 'Adaptive iteratively reweighted penalized least square'
+        return return_spectra
+
+    # Statistics-sensitive non-linear iterative peak-clipping, by C. G. Ryan et al. (1988)
+    def baseline_snip(self, max_half_window = 40, lls = True):
+        # max_half_window is about the half width of the broadest peak in points
+        # return a new spectra
+
+        z = sPyktro_baseline.snip(self.intensity, max_half_window = max_half_window, lls = lls)
+
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, self.intensity-z, "snip baseline corrected "+self.sample_name, 
+            parent = self, process = ("baseline_snip", {"max_half_window": max_half_window, "lls": lls}))
+        self.baseline = z
+        self.baseline_method = 'Statistics-sensitive non-linear iterative peak-clipping'
+        return return_spectra
+
+    def baseline_rolling_ball(self, half_window = 50, smooth_half_window = 0):
+        # half_window is the half width of the ball in points, larger than the half width of the broadest peak
+        # return a new spectra
+
+        z = sPyktro_baseline.rolling_ball(self.intensity, half_window = half_window, smooth_half_window = smooth_half_window)
+
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, self.intensity-z, "rolling ball baseline corrected "+self.sample_name, 
+            parent = self, process = ("baseline_rolling_ball", {"half_window": half_window, "smooth_half_window": smooth_half_window}))
+        self.baseline = z
+        self.baseline_method = 'Rolling ball'
+        return return_spectra
+
     def interpolate(self, start, end, num):
         '''
         input
@@ -173,7 +337,8 @@ class Raman_Spectra:
         xp = self.wavenumber
         fp = self.intensity
         y = np.interp(x, xp, fp, left=None, right=None)
-        return_spectra = Raman_Spectra(np.stack((x, y), axis = 1), "interpolated "+ self.sample_name)
+        return_spectra = Raman_Spectra.from_arrays(x, y, "interpolated "+ self.sample_name, 
+            parent = self, process = ("interpolate", {"start": start, "end": end, "num": num}))
         return return_spectra
 
     @classmethod
@@ -190,7 +355,8 @@ class Raman_Spectra:
             raise Exception("Wavenumbers have to be same for two raman spectra")
 
         new_intensity = rs_a.intensity - rs_b.intensity
-        return_spectra = cls(np.stack((rs_a.wavenumber, new_intensity), axis = 1), rs_a.sample_name+' MINUS '+rs_b.sample_name)
+        return_spectra = cls.from_arrays(rs_a.wavenumber, new_intensity, rs_a.sample_name+' MINUS '+rs_b.sample_name, 
+            parent = rs_a, process = ("spectra_subtraction", {"rs_b": rs_b.sample_name}))
         return return_spectra
 
     def spectra_scaling(self, scale_factor):
@@ -202,13 +368,37 @@ class Raman_Spectra:
             return spectra: a new spectra class with its intensity as intensity * scale_factor
         """
         new_intensity = self.intensity * scale_factor
-        return_spectra = Raman_Spectra(np.stack((self.wavenumber, new_intensity), axis = 1), self.sample_name + ' scaled by '+ str(round(scale_factor)))
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, new_intensity, self.sample_name + ' scaled by '+ str(round(scale_factor)), 
+            parent = self, process = ("spectra_scaling", {"scale_factor": scale_factor}))
         return return_spectra
     
+    def spectra_normalization(self, method = "max"):
+        """
+        input
+            method: "max" divides the intensity by its largest absolute value, "area" by the area under the spectra, "vector" by its euclidean norm
+
+        output
+            return spectra: a new spectra class with the normalized intensity
+        """
+        if method == "max":
+            norm = np.max(np.abs(self.intensity))
+        elif method == "area":
+            norm = np.abs(trapezoid(self.intensity, self.wavenumber))
+        elif method == "vector":
+            norm = np.linalg.norm(self.intensity)
+        else:
+            raise Exception("method has to be max, area or vector")
+
+        new_intensity = self.intensity / norm
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, new_intensity, self.sample_name + ' ' + method + ' normalized',
+            parent = self, process = ("spectra_normalization", {"method": method}))
+        return return_spectra
+
     def spectra_smoothing(self, filter_window, filter_degree):
 
         new_intensity = savgol_filter(self.intensity, filter_window, filter_degree)
-        return_spectra = Raman_Spectra(np.stack((self.wavenumber, new_intensity), axis = 1), self.sample_name + 'savgol smoothed ')
+        return_spectra = Raman_Spectra.from_arrays(self.wavenumber, new_intensity, self.sample_name + 'savgol smoothed ', 
+            parent = self, process = ("spectra_smoothing", {"filter_window": filter_window, "filter_degree": filter_degree}))
 
         return return_spectra
 
@@ -224,16 +414,39 @@ class Raman_Spectra:
 
         return raman_peaks
 
+    # The multi peak models evaluate all K peaks at once as a (K, n) array: the parameters are reshaped to one row per peak
+    # and broadcast against x. The *_jac functions are their analytic Jacobians, with one column per parameter in the order of params,
+    # curve_fit uses them through jac= instead of finite differences.
+
+    @staticmethod
+    def peak_parameters(params, para_num):
+        # split the flat parameter list into one (K, 1) column per peak parameter
+        if (len(params) % para_num ):
+            raise Exception("parameters have to be divisible by " + str(para_num))
+        return np.reshape(np.asarray(params, dtype = float), (-1, para_num)).T[:, :, np.newaxis]
+
+    @staticmethod
+    def peak_jacobian(*derivatives):
+        # (K, n) derivatives per parameter to the (n, para_num * K) Jacobian expected by curve_fit
+        jacobian = np.stack(derivatives, axis = 1)
+        return jacobian.reshape(-1, jacobian.shape[-1]).T
+
     @staticmethod
     def gaussian(x, mu, FWHM, amp):
         return amp*np.exp(-4*np.log(2)*((x-mu)/FWHM)**2)
 
     @classmethod
     def multi_gaussian(cls, x, *params):
-        if (len( np.array(params)) % 3 ):
-            raise Exception("parameters have to be divisible by 3")
+        mu, FWHM, amp = cls.peak_parameters(params, 3)
+        return np.sum(cls.gaussian(x, mu, FWHM, amp), axis = 0)
 
-        return sum([cls.gaussian(x, *params[ i : i+3 ]) for i in range( 0, len(params),3)])
+    @classmethod
+    def multi_gaussian_jac(cls, x, *params):
+        mu, FWHM, amp = cls.peak_parameters(params, 3)
+        u = (x-mu)/FWHM
+        g = np.exp(-4*np.log(2)*u**2)
+        d_mu = amp*g*8*np.log(2)*u/FWHM
+        return cls.peak_jacobian(d_mu, d_mu*u, g)
 
     @staticmethod
     def lorentzian(x, mu, FWHM, amp):
@@ -241,9 +454,16 @@ class Raman_Spectra:
 
     @classmethod
     def multi_lorentzian(cls, x, *params):
-        if (len( np.array(params)) % 3 ):
-            raise Exception("parameters have to be divisible by 3")
-        return sum([cls.lorentzian(x, *params[ i : i+3 ] ) for i in range( 0, len(params),3)])
+        mu, FWHM, amp = cls.peak_parameters(params, 3)
+        return np.sum(cls.lorentzian(x, mu, FWHM, amp), axis = 0)
+
+    @classmethod
+    def multi_lorentzian_jac(cls, x, *params):
+        mu, FWHM, amp = cls.peak_parameters(params, 3)
+        u = (x-mu)/FWHM
+        q = 1/(1+4*u**2)
+        d_mu = amp*8*u*q**2/FWHM
+        return cls.peak_jacobian(d_mu, d_mu*u, q)
 
     @classmethod
     def glsum(cls, x, mu, FWHM, amp, l_weight):
@@ -251,14 +471,256 @@ class Raman_Spectra:
 
     @classmethod
     def multi_glsum(cls, x, *params):
-        if (len( np.array(params)) % 4 ):
-            raise Exception("parameters have to be divisible by 4")
-        return sum([cls.glsum(x, *params[ i : i+4 ] ) for i in range( 0, len(params),4)])
+        mu, FWHM, amp, l_weight = cls.peak_parameters(params, 4)
+        return np.sum(cls.glsum(x, mu, FWHM, amp, l_weight), axis = 0)
+
+    @classmethod
+    def multi_glsum_jac(cls, x, *params):
+        mu, FWHM, amp, l_weight = cls.peak_parameters(params, 4)
+        u = (x-mu)/FWHM
+        g = np.exp(-4*np.log(2)*u**2)
+        q = 1/(1+4*u**2)
+        d_mu = amp*((1-l_weight)*g*8*np.log(2)*u + l_weight*8*u*q**2)/FWHM
+        return cls.peak_jacobian(d_mu, d_mu*u, (1-l_weight)*g + l_weight*q, amp*(q-g))
+
+    # Voigt profile from the real part of the Faddeeva function w(z), normalized to a peak height of amp at mu.
+    # With a = FWHM_G/(2*sqrt(ln 2)) = sqrt(2)*sigma and z = (x - mu + i*FWHM_L/2)/a, the peak height is Re w(i*FWHM_L/(2a)) = erfcx(FWHM_L/(2a)).
+
+    @staticmethod
+    def voigt(x, mu, FWHM_G, FWHM_L, amp):
+        a = FWHM_G/(2*np.sqrt(np.log(2)))
+        return amp*wofz((x - mu + 0.5j*FWHM_L)/a).real/erfcx(FWHM_L/(2*a))
+
+    @classmethod
+    def multi_voigt(cls, x, *params):
+        mu, FWHM_G, FWHM_L, amp = cls.peak_parameters(params, 4)
+        return np.sum(cls.voigt(x, mu, FWHM_G, FWHM_L, amp), axis = 0)
+
+    @classmethod
+    def multi_voigt_jac(cls, x, *params):
+        # from w'(z) = -2 z w(z) + 2i/sqrt(pi) and erfcx'(b) = 2 b erfcx(b) - 2/sqrt(pi)
+        mu, FWHM_G, FWHM_L, amp = cls.peak_parameters(params, 4)
+        a = FWHM_G/(2*np.sqrt(np.log(2)))
+        b = FWHM_L/(2*a)
+        z = (x - mu + 0.5j*FWHM_L)/a
+        w = wofz(z)
+        dw = -2*z*w + 2j/np.sqrt(np.pi)
+        norm = erfcx(b)
+        d_norm = 2*b*norm - 2/np.sqrt(np.pi)
+        v = w.real/norm
+
+        d_mu = amp*(-dw/a).real/norm
+        d_a = amp*((-dw*z/a).real/norm + v*d_norm*b/(a*norm))
+        d_gamma = amp*((1j*dw/a).real/norm - v*d_norm/(a*norm))
+        return cls.peak_jacobian(d_mu, d_a/(2*np.sqrt(np.log(2))), d_gamma/2, v)
+
+    # Pseudo-Voigt of Thompson, Cox and Hastings (1987): a gaussian and lorentzian sum with one FWHM f and the lorentzian weight eta
+    # given by FWHM_G and FWHM_L, within about 1.5% of the peak height of the Voigt profile without evaluating the Faddeeva function.
+
+    @staticmethod
+    def tch_width(FWHM_G, FWHM_L):
+        # f and eta of the pseudo-Voigt with their derivatives to FWHM_G and FWHM_L
+        G, L = FWHM_G, FWHM_L
+        P = G**5 + 2.69269*G**4*L + 2.42843*G**3*L**2 + 4.47163*G**2*L**3 + 0.07842*G*L**4 + L**5
+        dP_dG = 5*G**4 + 4*2.69269*G**3*L + 3*2.42843*G**2*L**2 + 2*4.47163*G*L**3 + 0.07842*L**4
+        dP_dL = 2.69269*G**4 + 2*2.42843*G**3*L + 3*4.47163*G**2*L**2 + 4*0.07842*G*L**3 + 5*L**4
+        f = P**0.2
+        df_dG = 0.2*dP_dG/f**4
+        df_dL = 0.2*dP_dL/f**4
+
+        r = L/f
+        eta = 1.36603*r - 0.47719*r**2 + 0.11116*r**3
+        deta_dr = 1.36603 - 2*0.47719*r + 3*0.11116*r**2
+        deta_dG = deta_dr*(-r/f)*df_dG
+        deta_dL = deta_dr*(1/f - r/f*df_dL)
+        return f, eta, df_dG, df_dL, deta_dG, deta_dL
 
-    #@classmethod
-    #def voigt(cls, x, )
+    @classmethod
+    def pseudo_voigt(cls, x, mu, FWHM_G, FWHM_L, amp):
+        f, eta = cls.tch_width(FWHM_G, FWHM_L)[:2]
+        return cls.glsum(x, mu, f, amp, eta)
+
+    @classmethod
+    def multi_pseudo_voigt(cls, x, *params):
+        mu, FWHM_G, FWHM_L, amp = cls.peak_parameters(params, 4)
+        return np.sum(cls.pseudo_voigt(x, mu, FWHM_G, FWHM_L, amp), axis = 0)
+
+    @classmethod
+    def multi_pseudo_voigt_jac(cls, x, *params):
+        # the multi_glsum derivatives to f and eta, chained to FWHM_G and FWHM_L
+        mu, FWHM_G, FWHM_L, amp = cls.peak_parameters(params, 4)
+        f, eta, df_dG, df_dL, deta_dG, deta_dL = cls.tch_width(FWHM_G, FWHM_L)
+        u = (x-mu)/f
+        g = np.exp(-4*np.log(2)*u**2)
+        q = 1/(1+4*u**2)
+        d_mu = amp*((1-eta)*g*8*np.log(2)*u + eta*8*u*q**2)/f
+        d_f = d_mu*u
+        d_eta = amp*(q-g)
+        return cls.peak_jacobian(d_mu, d_f*df_dG + d_eta*deta_dG, d_f*df_dL + d_eta*deta_dL, (1-eta)*g + eta*q)
+
+    @staticmethod
+    def gaussian_area(mu, FWHM, amp):
+        return amp*FWHM*np.sqrt(np.pi/(4*np.log(2)))
+
+    @staticmethod
+    def lorentzian_area(mu, FWHM, amp):
+        return amp*FWHM*np.pi/2
+
+    @classmethod
+    def glsum_area(cls, mu, FWHM, amp, l_weight):
+        return cls.gaussian_area(mu, FWHM, amp) * (1-l_weight) + cls.lorentzian_area(mu, FWHM, amp) * l_weight
+
+    @staticmethod
+    def voigt_area(mu, FWHM_G, FWHM_L, amp):
+        # the unit area Voigt profile peaks at erfcx(FWHM_L/(2a))/(a*sqrt(pi))
+        a = FWHM_G/(2*np.sqrt(np.log(2)))
+        return amp*a*np.sqrt(np.pi)/erfcx(FWHM_L/(2*a))
+
+    @classmethod
+    def pseudo_voigt_area(cls, mu, FWHM_G, FWHM_L, amp):
+        f, eta = cls.tch_width(FWHM_G, FWHM_L)[:2]
+        return cls.glsum_area(mu, f, amp, eta)
 
-    def peak_fitting(self, func, start, end, parameters = None, bounds = None, figure_size = (12, 8), peak_function = None):
+    @staticmethod
+    def peak_guess(mu, FWHM, amp):
+        # starting values and bounds of (mu, FWHM, amp) per peak from the detected position, width and height
+        parameters = np.stack((mu, FWHM, amp), axis = 1)
+        lower_bounds = np.stack((mu - FWHM, FWHM/4, np.zeros_like(amp)), axis = 1)
+        upper_bounds = np.stack((mu + FWHM, FWHM*4, amp*2), axis = 1)
+        return parameters, lower_bounds, upper_bounds
+
+    @classmethod
+    def glsum_guess(cls, mu, FWHM, amp):
+        # as peak_guess, with the lorentzian weight starting at 0.5 within [0, 1]
+        parameters, lower_bounds, upper_bounds = cls.peak_guess(mu, FWHM, amp)
+        return (np.column_stack((parameters, np.full_like(mu, 0.5))), np.column_stack((lower_bounds, np.zeros_like(mu))),
+            np.column_stack((upper_bounds, np.ones_like(mu))))
+
+    @staticmethod
+    def voigt_guess(mu, FWHM, amp):
+        # starting values and bounds of (mu, FWHM_G, FWHM_L, amp) per peak, with equal gaussian and lorentzian widths
+        # giving the detected FWHM, FWHM_V = 0.5346*FWHM_L + sqrt(0.2166*FWHM_L**2 + FWHM_G**2) of Olivero and Longbothum (1977)
+        width = FWHM/1.6376
+        parameters = np.stack((mu, width, width, amp), axis = 1)
+        lower_bounds = np.stack((mu - FWHM, FWHM/100, np.zeros_like(FWHM), np.zeros_like(amp)), axis = 1)
+        upper_bounds = np.stack((mu + FWHM, FWHM*4, FWHM*4, amp*2), axis = 1)
+        return parameters, lower_bounds, upper_bounds
+
+    @classmethod
+    def get_peak_models(cls):
+        # the multi peak models with their number of parameters per peak, single peak function, analytic Jacobian, analytic peak area
+        # and the function giving the starting values and bounds from detected peaks
+        return {
+            Raman_Spectra.multi_gaussian.__func__: (3, cls.gaussian, cls.multi_gaussian_jac, cls.gaussian_area, cls.peak_guess),
+            Raman_Spectra.multi_lorentzian.__func__: (3, cls.lorentzian, cls.multi_lorentzian_jac, cls.lorentzian_area, cls.peak_guess),
+            Raman_Spectra.multi_glsum.__func__: (4, cls.glsum, cls.multi_glsum_jac, cls.glsum_area, cls.glsum_guess),
+            Raman_Spectra.multi_voigt.__func__: (4, cls.voigt, cls.multi_voigt_jac, cls.voigt_area, cls.voigt_guess),
+            Raman_Spectra.multi_pseudo_voigt.__func__: (4, cls.pseudo_voigt, cls.multi_pseudo_voigt_jac, cls.pseudo_voigt_area, cls.voigt_guess),
+        }
+
+    def peak_fitting_guess(self, func, start, end, filter_window = None, filter_degree = None, lower_prominance = None, higher_prominance = None, lower_height = 0):
+        '''
+        Starting parameters and bounds for fit_peaks and peak_fitting from the peaks found by find_raman_peaks.
+        Positions come from the peak indices, FWHM from scipy peak_widths at half height and amplitudes from the peak heights.
+        Positions are bounded to mu +/- FWHM, FWHM to [FWHM/4, 4*FWHM] and amplitudes to [0, 2*height].
+
+        input
+            func: one of the multi peak models, multi_gaussian, multi_lorentzian, multi_glsum, multi_voigt or multi_pseudo_voigt
+            start: start raman shift for peak fitting, only the peaks between start and end are used
+            end: end raman shift for peak fitting
+            filter_window, filter_degree, lower_prominance, higher_prominance, lower_height: see find_raman_peaks
+
+        output
+            parameters and bounds for fit_peaks
+        '''
+        peak_model = self.get_peak_models().get(getattr(func, "__func__", func))
+        if peak_model is None:
+            raise Exception("func has to be one of the multi peak models of Raman_Spectra")
+
+        if filter_window is not None and filter_degree is not None:
+            intensity = savgol_filter(self.intensity, filter_window, filter_degree)
+        else:
+            intensity = self.intensity
+        # the same peaks as find_raman_peaks, on the intensity smoothed above. raman_peaks is left as it is
+        peaks_index, _ = find_peaks(intensity, prominence = (lower_prominance, higher_prominance), height = lower_height)
+        in_range = (self.wavenumber[peaks_index] >= min(start, end)) & (self.wavenumber[peaks_index] <= max(start, end))
+        peaks_index = peaks_index[in_range]
+        if peaks_index.size == 0:
+            raise Exception("No Raman peaks found between " + str(start) + " and " + str(end))
+
+        # the width in points is converted to raman shift through the wavenumber at the interpolated half height positions
+        _, width_heights, left_ips, right_ips = peak_widths(intensity, peaks_index, rel_height = 0.5)
+        point_index = np.arange(self.wavenumber.shape[0])
+        FWHM = np.abs(np.interp(right_ips, point_index, self.wavenumber) - np.interp(left_ips, point_index, self.wavenumber))
+
+        mu = self.wavenumber[peaks_index].astype(float)
+        FWHM = np.maximum(FWHM, np.abs(np.mean(np.diff(self.wavenumber))))
+        amp = np.maximum(intensity[peaks_index], np.finfo(float).eps).astype(float)
+
+        parameters, lower_bounds, upper_bounds = peak_model[4](mu, FWHM, amp)
+        return parameters.ravel().tolist(), (lower_bounds.ravel().tolist(), upper_bounds.ravel().tolist())
+
+    @classmethod
+    def get_peak_model_jac(cls, func):
+        # analytic Jacobian of one of the multi peak models, None for any other model function
+        peak_model = cls.get_peak_models().get(getattr(func, "__func__", func))
+        if peak_model is None:
+            return None
+        return peak_model[2]
+
+    def fit_peaks(self, func, start, end, parameters = None, bounds = None, jac = None, peak_function = None, maxfev = 10000):
+        '''
+        Raman peak fitting without plotting, for batch jobs. Use Peak_Fit_Result.plot() to check the fitting result.
+
+        input
+            func: the fitting model function used for peak fitting
+            start: start raman shift for peak fitting
+            end: end raman shift for peak fitting
+            parameters: guess parameters for curve fitting
+            bounds: bounds for curve fitting
+            jac: Jacobian of func for curve_fit. Default is the analytic Jacobian for the multi peak models, and finite differences for any other function
+            peak_function: single peak function of func, only needed for the peak areas of a model that is not one of the multi peak models
+            maxfev: maximum number of function evaluations
+
+        output
+            a Peak_Fit_Result
+        '''
+        start_index = np.argmin(np.abs(self.wavenumber - start))
+        end_index = np.argmin(np.abs(self.wavenumber - end))
+
+        x = self.wavenumber[start_index:end_index]
+        y = self.intensity[start_index:end_index]
+
+        return self.fit_peak_arrays(x, y, func, parameters = parameters, bounds = bounds, jac = jac, peak_function = peak_function, maxfev = maxfev, sample_name = self.sample_name)
+
+    @classmethod
+    def fit_peak_arrays(cls, x, y, func, parameters = None, bounds = None, jac = None, peak_function = None, maxfev = 10000, sample_name = ""):
+        # fit_peaks on the raman shift x and intensity y of the fitting range, used by the batch fitting workers
+        peak_model = cls.get_peak_models().get(getattr(func, "__func__", func))
+        if jac is None and peak_model is not None:
+            jac = peak_model[2]
+
+        fit_time = time.perf_counter()
+        if bounds is None:
+            popt, pcov, infodict, _, _ = curve_fit(func, x, y, p0=parameters, jac=jac, maxfev = maxfev, full_output = True)
+        else:
+            popt, pcov, infodict, _, _ = curve_fit(func, x, y, p0=parameters, bounds=bounds, jac=jac, maxfev = maxfev, full_output = True)
+        fit_time = time.perf_counter() - fit_time
+
+        # area of each fitted peak, analytic for the multi peak models and numerical over the fitting range otherwise
+        if peak_model is not None:
+            func_para_num = peak_model[0]
+            peak_areas = peak_model[3](*np.reshape(popt, (-1, func_para_num)).T)
+        elif peak_function is not None:
+            func_para_num = len(signature(peak_function).parameters)-1
+            peak_areas = np.array([trapezoid(peak_function(x, *popt[i:i+func_para_num]), x) for i in range(0, popt.shape[0], func_para_num)])
+        else:
+            func_para_num = None
+            peak_areas = None
+
+        return Peak_Fit_Result(sample_name, func, x, y, popt, pcov, func_para_num, peak_areas, infodict['nfev'], fit_time)
+
+    def peak_fitting(self, func, start, end, parameters = None, bounds = None, figure_size = (12, 8), peak_function = None, jac = None):
         '''
         Raman peak fitting
         
@@ -270,51 +732,78 @@ class Raman_Spectra:
             bounds: bounds for curve fitting
             figure_size: plot the fit result figure
             peak_function: choose the peak function used for plotting each fitted peak
+            jac: Jacobian of func for curve_fit. Default is the analytic Jacobian for the multi peak models,
+                and finite differences for any other function
 
         
         output
             popt and pcov. the return value of scipy curve_fit
         '''
 
-        start_index = np.argmin(np.abs(self.spectra_data[:,0] - start))
-        end_index = np.argmin(np.abs(self.spectra_data[:,0] - end))
+        fit_result = self.fit_peaks(func, start, end, parameters = parameters, bounds = bounds, jac = jac, peak_function = peak_function)
+        fit_result.plot(figure_size = figure_size, peak_function = peak_function)
+            
+        return fit_result.popt, fit_result.pcov
 
-        x = np.copy(self.wavenumber[start_index:end_index])
-        y = np.copy(self.intensity[start_index:end_index])
 
-        if bounds is None:
-            popt, pcov = curve_fit(func, x, y, p0=parameters, maxfev = 10000)
-        else:
-            popt, pcov = curve_fit(func, x, y, p0=parameters, bounds=bounds, maxfev = 10000)
+class Peak_Fit_Result:
+    # result of Raman_Spectra.fit_peaks. Only holds arrays, matplotlib is imported when plot() is called
+
+    def __init__(self, sample_name, func, x, y, popt, pcov, func_para_num, peak_areas, nfev, fit_time):
+        self.sample_name = sample_name
+        self.func = func
+        self.x = x # raman shift of the fitting range
+        self.y = y # intensity of the fitting range
+        self.popt = popt
+        self.pcov = pcov
+        self.perr = np.sqrt(np.diag(pcov)) # one standard deviation error of popt
+        self.func_para_num = func_para_num # number of parameters per peak, None if unknown
+        self.peak_areas = peak_areas # area of each fitted peak, None if unknown
+        self.nfev = nfev # number of function evaluations
+        self.fit_time = fit_time # wall time of curve_fit in seconds
+
+        self.fitted_y = func(x, *popt)
+        self.residuals = y - self.fitted_y
+
+    def __str__(self):
+        return self.sample_name + " peak fitting result"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def plot(self, figure_size = (12, 8), peak_function = None, show_figure = True):
+        # plot the fitting range, each fitted peak if peak_function is given, and the fitted sum
+        import matplotlib.pyplot as plt
+
+        x = self.x
+        popt = self.popt
 
         fig, axs = plt.subplots(1, 1, figsize=figure_size)
-        axs.plot(x, y, color = 'k', linewidth = 1)
+        axs.plot(x, self.y, color = 'k', linewidth = 1)
 
 
         # plot individual peaks
         if peak_function is not None:
             sig = signature(peak_function)
             func_para_num = len(sig.parameters)-1
-            print(len(sig.parameters)-1)
             camp_i = 0
-            cmap = plt.cm.get_cmap('rainbow', popt.shape[0]/func_para_num)
+            cmap = plt.get_cmap('rainbow', popt.shape[0]//func_para_num)
             for i in range( 0, popt.shape[0], func_para_num):
                 peak_y = peak_function(x, *popt[i:i+func_para_num])
                 axs.plot(x, peak_y, linewidth = 1, color=cmap(camp_i), label = "Mu: " + str("{:.2f}".format(popt[i])) + " FWHM: " + str("{:.2f}".format(popt[i+1])))
                 camp_i += 1
 
         # sum plot
-        fitted_y = func(x, *popt)
-        axs.plot(x, fitted_y, color = 'b', linewidth = 1)
-        axs.legend()
+        axs.plot(x, self.fitted_y, color = 'b', linewidth = 1)
+        if peak_function is not None:
+            axs.legend()
 
 
         axs.set_xlabel("Raman shift 1/cm")
         axs.set_ylabel("Intensity")
         axs.hlines(0, x[0], x[-1], colors = 'k', linewidths = 0.5)
 
-        plt.show()
-        
-            
-        return popt, pcov
+        if show_figure:
+            plt.show()
 
+        return fig, axs
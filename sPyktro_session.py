@@ -0,0 +1,190 @@
+import os
+import json
+import tempfile
+import numpy as np
+from sPyktro_raman import Raman_Spectra
+
+# A session file is an uncompressed npz archive: one array per intensity and per distinct wavenumber axis,
+# and a json string under "metadata" with the name, styling, extents and processing lineage of every spectra.
+# np.load reads the members of an npz file only when they are accessed, so a session opens with the metadata alone
+# and each spectra reads its arrays the first time they are used.
+
+session_version = 1
+
+
+def save_session(path, snapshots, view_limits = None):
+    '''
+    input
+        path: the session file, written to a temporary file first and moved in place
+        snapshots: list of (spectra, line_rgba, line_width, plot_bool, select_bool), see Spectra_item.snapshot
+        view_limits: (xmin, xmax, ymin, ymax) of the plot area, or None
+    '''
+    arrays = {}
+    array_keys = {} # id of an array already written -> its key
+    wavenumber_candidates = {} # (length, first, last) -> [(array, key)], finds equal wavenumber axes of different spectras
+    spectra_metadata = []
+
+    for i, (spectra, line_rgba, line_width, plot_bool, select_bool) in enumerate(snapshots):
+        wavenumber, intensity = spectra.get_spectra_view()
+
+        wavenumber_key = array_keys.get(id(spectra.wavenumber))
+        if wavenumber_key is None:
+            candidate_key = (wavenumber.shape[0], float(wavenumber[0]), float(wavenumber[-1])) if wavenumber.shape[0] else (0, 0.0, 0.0)
+            for candidate, key in wavenumber_candidates.get(candidate_key, []):
+                if np.array_equal(candidate, wavenumber):
+                    wavenumber_key = key
+                    break
+            if wavenumber_key is None:
+                wavenumber_key = "wavenumber_" + str(i)
+                arrays[wavenumber_key] = wavenumber
+                wavenumber_candidates.setdefault(candidate_key, []).append((wavenumber, wavenumber_key))
+            array_keys[id(spectra.wavenumber)] = wavenumber_key
+
+        intensity_key = array_keys.get(id(spectra.intensity))
+        if intensity_key is None:
+            intensity_key = "intensity_" + str(i)
+            arrays[intensity_key] = intensity
+            array_keys[id(spectra.intensity)] = intensity_key
+
+        spectra_metadata.append({
+            "sample_name": spectra.sample_name,
+            "wavenumber_key": wavenumber_key,
+            "intensity_key": intensity_key,
+            "extents": spectra.get_extents(),
+            "lineage": spectra.get_lineage(),
+            "file_path": None if spectra.file_path is None else str(spectra.file_path),
+            "start": spectra.start,
+            "end": spectra.end,
+            "line_rgba": line_rgba,
+            "line_width": line_width,
+            "plot_bool": plot_bool,
+            "select_bool": select_bool,
+        })
+
+    metadata = {"version": session_version, "view_limits": view_limits, "spectras": spectra_metadata}
+    arrays["metadata"] = np.array(json.dumps(metadata, default = str))
+
+    session_dir = os.path.dirname(os.path.abspath(path))
+    temp_fd, temp_path = tempfile.mkstemp(suffix = ".npz", dir = session_dir)
+    try:
+        with os.fdopen(temp_fd, "wb") as session_file:
+            np.savez(session_file, **arrays)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def open_session(path):
+    '''
+    Read the metadata of a session file, the spectra arrays stay on disk until they are used.
+
+    output
+        snapshots: list of (Session_Spectra, line_rgba, line_width, plot_bool, select_bool), see Spectra_item.from_snapshot
+        view_limits: (xmin, xmax, ymin, ymax) of the plot area, or None
+        session_file: the open Session_File the spectras read from, close it once they are no longer used
+    '''
+    session_file = Session_File(path)
+    metadata = session_file.get_metadata()
+    if metadata.get("version") != session_version:
+        session_file.close()
+        raise Exception(os.path.basename(path) + " is not a sPyktro session file of version " + str(session_version))
+
+    snapshots = []
+    for spectra_metadata in metadata["spectras"]:
+        spectra = Session_Spectra.from_session(session_file, spectra_metadata)
+        snapshots.append((spectra, spectra_metadata["line_rgba"], spectra_metadata["line_width"],
+            spectra_metadata["plot_bool"], spectra_metadata["select_bool"]))
+
+    return snapshots, metadata["view_limits"], session_file
+
+
+class Session_File:
+    # an open session file. Each array is read once, on first use, and shared by all spectras using it
+
+    def __init__(self, path):
+        self.path = path
+        self.npz = np.load(path, allow_pickle = False)
+        self.arrays = {}
+
+    def get_metadata(self):
+        return json.loads(str(self.npz["metadata"]))
+
+    def get_array(self, key):
+        array = self.arrays.get(key)
+        if array is None:
+            if self.npz is None:
+                raise Exception("The session file " + os.path.basename(self.path) + " is closed")
+            array = self.npz[key]
+            array.flags.writeable = False
+            self.arrays[key] = array
+        return array
+
+    def read_all(self):
+        # read every array not read yet, so the spectras stay usable after the file is closed, e.g. before it is overwritten
+        for key in self.npz.files:
+            if key != "metadata":
+                self.get_array(key)
+
+    def close(self):
+        if self.npz is not None:
+            self.npz.close()
+            self.npz = None
+
+
+class Session_Spectra(Raman_Spectra):
+    # a Raman_Spectra of a session file, reading wavenumber and intensity from the file the first time they are used.
+    # The name, extents and lineage come from the metadata, so listing the spectra and resetting the axis read no array
+
+    session_file = None
+    wavenumber_key = None
+    intensity_key = None
+
+    @classmethod
+    def from_session(cls, session_file, spectra_metadata):
+        return_spectra = cls.__new__(cls)
+        return_spectra.session_file = session_file
+        return_spectra.wavenumber_key = spectra_metadata["wavenumber_key"]
+        return_spectra.intensity_key = spectra_metadata["intensity_key"]
+        return_spectra.loaded_wavenumber = None
+        return_spectra.loaded_intensity = None
+
+        return_spectra.file_path = spectra_metadata["file_path"]
+        return_spectra._spectra_data = None
+        return_spectra.start = spectra_metadata["start"]
+        return_spectra.end = spectra_metadata["end"]
+        return_spectra.sample_name = spectra_metadata["sample_name"]
+
+        return_spectra.raman_peaks = None
+        return_spectra.baseline = None
+        return_spectra.baseline_method = None
+
+        return_spectra.parent = None
+        return_spectra.process = None
+        return_spectra.saved_lineage = [tuple(step) for step in spectra_metadata["lineage"]]
+
+        return_spectra.extents = tuple(spectra_metadata["extents"])
+
+        return return_spectra
+
+    # processing functions building a spectra from arrays set wavenumber and intensity directly, nothing is read then
+
+    @property
+    def wavenumber(self):
+        if self.__dict__.get("loaded_wavenumber") is None:
+            self.loaded_wavenumber = self.session_file.get_array(self.wavenumber_key)
+        return self.loaded_wavenumber
+
+    @wavenumber.setter
+    def wavenumber(self, wavenumber):
+        self.loaded_wavenumber = wavenumber
+
+    @property
+    def intensity(self):
+        if self.__dict__.get("loaded_intensity") is None:
+            self.loaded_intensity = self.session_file.get_array(self.intensity_key)
+        return self.loaded_intensity
+
+    @intensity.setter
+    def intensity(self, intensity):
+        self.loaded_intensity = intensity
@@ -0,0 +1,244 @@
+import numpy as np
+from scipy.signal import savgol_filter
+from scipy.integrate import trapezoid
+from sPyktro_raman import Raman_Spectra
+import sPyktro_baseline
+from sPyktro_peaks import find_stack_peaks
+
+
+class Spectra_Stack:
+    # N raman spectra sharing one wavenumber axis, stored as one contiguous (N, L) intensity array.
+    # Every processing function runs as a batched numpy / scipy call over axis 1 and returns a new Spectra_Stack,
+    # the same way the Raman_Spectra functions return a new Raman_Spectra.
+
+    def __init__(self, wavenumber, intensity, sample_names = None, parent = None, process = None):
+        '''
+        input
+            wavenumber: 1-D array of raman shift, shared by all spectra
+            intensity: (N, L) array of intensity, one spectra per row
+            sample_names: list of N names. Default is the row number
+            parent: the stack this one is derived from, if any
+            process: (name, parameters) of the processing step that derived this stack from parent
+        '''
+        wavenumber = np.asarray(wavenumber)
+        intensity = np.asarray(intensity)
+        if intensity.ndim == 1:
+            intensity = intensity[np.newaxis, :]
+        if wavenumber.ndim != 1 or intensity.ndim != 2 or intensity.shape[1] != wavenumber.shape[0]:
+            raise Exception("intensity has to be a (N, L) array with L the length of wavenumber")
+
+        if sample_names is None:
+            sample_names = [str(i) for i in range(intensity.shape[0])]
+        if len(sample_names) != intensity.shape[0]:
+            raise Exception("sample_names has to have one name per spectra")
+
+        self.wavenumber = wavenumber
+        self.intensity = intensity
+        self.sample_names = list(sample_names)
+
+        self.parent = parent
+        self.process = process
+
+        self.baseline = None # (N, L) baseline, set by the baseline correction functions
+        self.baseline_method = None
+        self.raman_peaks = None # Stack_Peaks, set by find_raman_peaks
+
+    @classmethod
+    def from_spectra(cls, spectra_list):
+        '''
+        input
+            spectra_list: list of Raman_Spectra with the same wavenumber. Use interpolate() on each spectra first otherwise
+
+        output
+            a new Spectra_Stack with one row per spectra
+        '''
+        if len(spectra_list) == 0:
+            raise Exception("spectra_list is empty")
+
+        wavenumber = spectra_list[0].wavenumber
+        intensity = np.empty((len(spectra_list), wavenumber.shape[0]), dtype = np.result_type(*[rs.intensity for rs in spectra_list]))
+        for i, rs in enumerate(spectra_list):
+            if rs.wavenumber is not wavenumber and not np.array_equal(rs.wavenumber, wavenumber):
+                raise Exception("Wavenumbers have to be same for all raman spectra in a stack, " + rs.sample_name + " is different")
+            intensity[i] = rs.intensity
+
+        return cls(wavenumber, intensity, [rs.sample_name for rs in spectra_list])
+
+    def __len__(self):
+        return self.intensity.shape[0]
+
+    def __getitem__(self, i):
+        # a row of the stack as a Raman_Spectra, sharing the stack memory
+        return Raman_Spectra.from_arrays(self.wavenumber, self.intensity[i], self.sample_names[i])
+
+    def __str__(self):
+        return "Spectra_Stack of " + str(len(self)) + " spectra"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def to_spectra(self):
+        return [self[i] for i in range(len(self))]
+
+    def new_stack(self, wavenumber, intensity, sample_names, process):
+        return Spectra_Stack(wavenumber, intensity, sample_names, parent = self, process = process)
+
+    def cut(self, start = 0, end = None):
+        start_index = np.argmin(np.abs(self.wavenumber - start))
+        if end:
+            end_index = np.argmin(np.abs(self.wavenumber - end))
+        else:
+            end_index = None
+
+        # column slices are views of the parent stack
+        return self.new_stack(self.wavenumber[start_index:end_index], self.intensity[:, start_index:end_index], self.sample_names,
+            ("cut", {"start": start, "end": end}))
+
+    def interpolate(self, start, end, num):
+        '''
+        Linear interpolation of every spectra on the same new raman shift sequence, same as np.interp row by row.
+        The interpolation indices and weights are computed once and applied to all rows.
+
+        input
+            start: The starting value of the ramanshift sequence.
+            end: The end value of the ramanshift sequence
+            num: Number of samples ramanshift to generate.
+        '''
+        x = np.linspace(start, end, num)
+        xp = self.wavenumber
+        fp = self.intensity
+        if xp[0] > xp[-1]: # raman shift saved in decreasing order
+            xp = xp[::-1]
+            fp = fp[:, ::-1]
+
+        right_index = np.clip(np.searchsorted(xp, x, side = 'right'), 1, xp.shape[0] - 1)
+        left_index = right_index - 1
+        weight = np.clip((x - xp[left_index]) / (xp[right_index] - xp[left_index]), 0, 1)
+
+        y = fp[:, left_index] * (1 - weight) + fp[:, right_index] * weight
+
+        return self.new_stack(x, y, ["interpolated " + name for name in self.sample_names],
+            ("interpolate", {"start": start, "end": end, "num": num}))
+
+    @classmethod
+    def spectra_subtraction(cls, stack_a, b):
+        '''
+        input
+            stack_a: a Spectra_Stack
+            b: a Spectra_Stack with the same number of spectra, or a Raman_Spectra subtracted from every row
+
+        output
+            a new Spectra_Stack with the intensity as stack_a.intensity - b.intensity
+        '''
+        if not np.array_equal(stack_a.wavenumber, b.wavenumber):
+            raise Exception("Wavenumbers have to be same for the raman spectra")
+
+        if isinstance(b, Spectra_Stack):
+            if len(b) != len(stack_a):
+                raise Exception("The two stacks have to have the same number of spectra")
+            sample_names = [name_a + ' MINUS ' + name_b for name_a, name_b in zip(stack_a.sample_names, b.sample_names)]
+            process = ("spectra_subtraction", {"b": str(b)})
+        else:
+            sample_names = [name_a + ' MINUS ' + b.sample_name for name_a in stack_a.sample_names]
+            process = ("spectra_subtraction", {"b": b.sample_name})
+
+        new_intensity = stack_a.intensity - b.intensity
+        return Spectra_Stack(stack_a.wavenumber, new_intensity, sample_names, parent = stack_a, process = process)
+
+    def spectra_scaling(self, scale_factor):
+        '''
+        input
+            scale_factor: a factor for scaling the intensity, or an array with one factor per spectra
+        '''
+        scale_factor = np.asarray(scale_factor)
+        if scale_factor.ndim == 0:
+            new_intensity = self.intensity * scale_factor
+            sample_names = [name + ' scaled by ' + str(round(float(scale_factor))) for name in self.sample_names]
+        else:
+            new_intensity = self.intensity * scale_factor[:, np.newaxis]
+            sample_names = [name + ' scaled' for name in self.sample_names]
+
+        return self.new_stack(self.wavenumber, new_intensity, sample_names, ("spectra_scaling", {"scale_factor": scale_factor.tolist()}))
+
+    def spectra_normalization(self, method = "max"):
+        # see Raman_Spectra.spectra_normalization, every row is divided by its own norm
+        if method == "max":
+            norm = np.max(np.abs(self.intensity), axis = 1)
+        elif method == "area":
+            norm = np.abs(trapezoid(self.intensity, self.wavenumber, axis = 1))
+        elif method == "vector":
+            norm = np.linalg.norm(self.intensity, axis = 1)
+        else:
+            raise Exception("method has to be max, area or vector")
+
+        new_intensity = self.intensity / norm[:, np.newaxis]
+        return self.new_stack(self.wavenumber, new_intensity, [name + ' ' + method + ' normalized' for name in self.sample_names],
+            ("spectra_normalization", {"method": method}))
+
+    def spectra_smoothing(self, filter_window, filter_degree):
+        new_intensity = savgol_filter(self.intensity, filter_window, filter_degree, axis = 1)
+        return self.new_stack(self.wavenumber, new_intensity, [name + 'savgol smoothed ' for name in self.sample_names],
+            ("spectra_smoothing", {"filter_window": filter_window, "filter_degree": filter_degree}))
+
+    def find_raman_peaks(self, filter_window = None, filter_degree = None, lower_prominance = None, higher_prominance = None, lower_height = 0):
+        '''
+        Raman_Spectra.find_raman_peaks for every spectra of the stack. Use track_peaks() of the result to follow the peaks along the stack.
+
+        output
+            a Stack_Peaks with the peaks of all spectra as flat arrays
+        '''
+        raman_peaks = find_stack_peaks(self.wavenumber, self.intensity, filter_window = filter_window, filter_degree = filter_degree,
+            lower_prominance = lower_prominance, higher_prominance = higher_prominance, lower_height = lower_height)
+        self.raman_peaks = raman_peaks
+
+        return raman_peaks
+
+    def baseline_als(self, lam = 100, p = 0.01, niter = 10):
+        # lam is for smoothness and p is for assymmetry, see Raman_Spectra.baseline_als
+        z = sPyktro_baseline.als(self.intensity, lam = lam, p = p, niter = niter)
+
+        self.baseline = z
+        self.baseline_method = 'Asymmetric least square'
+        return self.new_stack(self.wavenumber, self.intensity - z, ["als baseline corrected " + name for name in self.sample_names],
+            ("baseline_als", {"lam": lam, "p": p, "niter": niter}))
+
+    def baseline_modpoly(self, degree = 2, repitition = 100, gradient = 0.001):
+        # see Raman_Spectra.baseline_modpoly. All rows are fitted together, each row stops once it has converged
+        y_work = sPyktro_baseline.modpoly(self.intensity, degree = degree, repitition = repitition, gradient = gradient)
+
+        self.baseline = y_work
+        self.baseline_method = 'Modified polyfit'
+        return self.new_stack(self.wavenumber, self.intensity - y_work, ["modpoly baseline corrected " + name for name in self.sample_names],
+            ("baseline_modpoly", {"degree": degree, "repitition": repitition, "gradient": gradient}))
+
+    def baseline_arpls(self, lam = 1e5, ratio = 0.001, niter = 50):
+        z = sPyktro_baseline.arpls(self.intensity, lam = lam, ratio = ratio, niter = niter)
+
+        self.baseline = z
+        self.baseline_method = 'Asymmetrically reweighted penalized least square'
+        return self.new_stack(self.wavenumber, self.intensity - z, ["arpls baseline corrected " + name for name in self.sample_names],
+            ("baseline_arpls", {"lam": lam, "ratio": ratio, "niter": niter}))
+
+    def baseline_airpls(self, lam = 100, niter = 15):
+        z = sPyktro_baseline.airpls(self.intensity, lam = lam, niter = niter)
+
+        self.baseline = z
+        self.baseline_method = 'Adaptive iteratively reweighted penalized least square'
+        return self.new_stack(self.wavenumber, self.intensity - z, ["airpls baseline corrected " + name for name in self.sample_names],
+            ("baseline_airpls", {"lam": lam, "niter": niter}))
+
+    def baseline_snip(self, max_half_window = 40, lls = True):
+        z = sPyktro_baseline.snip(self.intensity, max_half_window = max_half_window, lls = lls)
+
+        self.baseline = z
+        self.baseline_method = 'Statistics-sensitive non-linear iterative peak-clipping'
+        return self.new_stack(self.wavenumber, self.intensity - z, ["snip baseline corrected " + name for name in self.sample_names],
+            ("baseline_snip", {"max_half_window": max_half_window, "lls": lls}))
+
+    def baseline_rolling_ball(self, half_window = 50, smooth_half_window = 0):
+        z = sPyktro_baseline.rolling_ball(self.intensity, half_window = half_window, smooth_half_window = smooth_half_window)
+
+        self.baseline = z
+        self.baseline_method = 'Rolling ball'
+        return self.new_stack(self.wavenumber, self.intensity - z, ["rolling ball baseline corrected " + name for name in self.sample_names],
+            ("baseline_rolling_ball", {"half_window": half_window, "smooth_half_window": smooth_half_window}))
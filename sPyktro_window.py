@@ -17,7 +17,7 @@ from PySide6.QtGui import (QAction, QBrush, QColor, QConicalGradient,
     QPainter, QPalette, QPixmap, QRadialGradient,
     QTransform)
 from PySide6.QtWidgets import (QAbstractItemView, QApplication, QGridLayout, QHBoxLayout,
-    QLabel, QLineEdit, QListWidget, QListWidgetItem,
+    QLabel, QLineEdit, QListView,
     QMainWindow, QMenu, QMenuBar, QPushButton,
     QSizePolicy, QSpacerItem, QStatusBar, QWidget)
 
@@ -104,18 +104,19 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout_2.addWidget(self.graphWidget)
 
-        self.listWidget = QListWidget(self.centralwidget)
-        self.listWidget.setObjectName(u"listWidget")
+        self.listView = QListView(self.centralwidget)
+        self.listView.setObjectName(u"listView")
         sizePolicy1 = QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         sizePolicy1.setHorizontalStretch(1)
         sizePolicy1.setVerticalStretch(0)
-        sizePolicy1.setHeightForWidth(self.listWidget.sizePolicy().hasHeightForWidth())
-        self.listWidget.setSizePolicy(sizePolicy1)
-        self.listWidget.setMinimumSize(QSize(100, 405))
-        self.listWidget.setMaximumSize(QSize(200, 16777215))
-        self.listWidget.setSelectionMode(QAbstractItemView.ExtendedSelection)
-
-        self.horizontalLayout_2.addWidget(self.listWidget)
+        sizePolicy1.setHeightForWidth(self.listView.sizePolicy().hasHeightForWidth())
+        self.listView.setSizePolicy(sizePolicy1)
+        self.listView.setMinimumSize(QSize(100, 405))
+        self.listView.setMaximumSize(QSize(200, 16777215))
+        self.listView.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.listView.setUniformItemSizes(True)
+
+        self.horizontalLayout_2.addWidget(self.listView)
 
 
         self.gridLayout.addLayout(self.horizontalLayout_2, 0, 0, 1, 1)